@@ -0,0 +1,326 @@
+"""Benchmark performance of ``escapecalculator``.
+
+Times constructing :class:`escapecalculator.EscapeCalculator` from local files,
+constructing calculators for all viruses, single calls to compute binding retained
+and escape per site, and bulk scoring of synthetic sets of mutated sites. The
+timings can be saved as a baseline, and compared to a previously saved baseline to
+detect if changes to the data or code made the calculator slower.
+
+You can either use functions in module or run as command-line tool.
+
+"""
+
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+
+import numpy
+
+import pandas as pd
+
+import escapecalculator
+
+
+def synthetic_mutated_sites(sites, n, *, max_mutated=20, seed=0):
+    """Random sets of mutated sites.
+
+    Parameters
+    ----------
+    sites : array-like of integers
+        Sites that can be mutated.
+    n : int
+        Number of sets of mutated sites.
+    max_mutated : int
+        Each set has between zero and this many mutated sites.
+    seed : int
+        Seed for the random number generator.
+
+    Returns
+    -------
+    list
+        List of `n` lists of mutated sites.
+
+    """
+    rng = numpy.random.default_rng(seed)
+    sites = numpy.array(sorted(sites))
+    n_mutated = rng.integers(0, max_mutated + 1, size=n)
+    # the random key for each site orders the sites mutated in each set
+    keys = rng.random((n, len(sites)))
+    order = numpy.argsort(keys, axis=1)[:, :max_mutated]
+    return [sites[row[:k]].tolist() for row, k in zip(order, n_mutated)]
+
+
+def time_call(func, repeat):
+    """Time calls to a function.
+
+    Parameters
+    ----------
+    func : callable
+        Function called with no arguments.
+    repeat : int
+        Number of times to call the function.
+
+    Returns
+    -------
+    dict
+        Minimum and median time of a call in seconds.
+
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {"min": min(times), "median": statistics.median(times)}
+
+
+def run_benchmarks(
+    escape,
+    antibody_ic50s,
+    antibody_sources,
+    antibody_reweighting,
+    config,
+    *,
+    sizes=(1000, 10000, 100000),
+    repeat=5,
+    log=None,
+):
+    """Run benchmarks of the escape calculator.
+
+    Parameters
+    ----------
+    escape : str
+        Path to escape data as for :class:`escapecalculator.EscapeCalculator`.
+    antibody_ic50s : str
+        Path to antibody IC50s as for :class:`escapecalculator.EscapeCalculator`.
+    antibody_sources : str
+        Path to antibody sources as for :class:`escapecalculator.EscapeCalculator`.
+    antibody_reweighting : str
+        Path to antibody reweighting as for :class:`escapecalculator.EscapeCalculator`.
+    config : str
+        Path to configuration as for :class:`escapecalculator.EscapeCalculator`.
+    sizes : array-like of integers
+        Numbers of synthetic sets of mutated sites to score in bulk.
+    repeat : int
+        Time each benchmark this many times, except bulk scoring of more than
+        100000 sets of mutated sites which is only timed once.
+    log : None or writable file-like object
+        If not `None`, write the timing of each benchmark as it finishes.
+
+    Returns
+    -------
+    dict
+        Has keys "metadata" describing the benchmarked data and machine, and
+        "results" giving the minimum and median time of each benchmark.
+
+    """
+    paths = [escape, antibody_ic50s, antibody_sources, antibody_reweighting, config]
+    results = {}
+
+    def run(name, func, n_repeat=repeat):
+        results[name] = time_call(func, n_repeat)
+        if log is not None:
+            log.write(
+                f"{name}: {results[name]['min']:.4g} seconds min, "
+                f"{results[name]['median']:.4g} median\n"
+            )
+            log.flush()
+
+    run("init", lambda: escapecalculator.EscapeCalculator(*paths))
+    escape_data = escapecalculator.EscapeData(*paths)
+    viruses = sorted(escape_data.antibody_ic50s["virus"].unique())
+    run(
+        "init_all_viruses",
+        lambda: [escape_data.calculator(virus=virus) for virus in viruses],
+    )
+
+    calc = escape_data.calculator()
+    mutated_sites = synthetic_mutated_sites(calc.sites, 100, seed=1)
+    run(
+        "binding_retained",
+        lambda: [calc.binding_retained(sites) for sites in mutated_sites],
+    )
+    run(
+        "escape_per_site",
+        lambda: [calc.escape_per_site(sites) for sites in mutated_sites],
+    )
+
+    for n in sizes:
+        mutated_sites = synthetic_mutated_sites(calc.sites, n, seed=n)
+        n_repeat = repeat if n <= 100000 else 1
+        run(
+            f"binding_retained_many_{n}",
+            lambda: calc.binding_retained_many(mutated_sites),
+            n_repeat,
+        )
+        run(
+            f"escape_per_site_many_{n}",
+            lambda: calc.escape_per_site_many(mutated_sites, as_array=True),
+            n_repeat,
+        )
+
+    metadata = {
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "n_escape_rows": len(escape_data.escape),
+        "n_antibodies": calc.data["antibody"].nunique(),
+        "n_viruses": len(viruses),
+        "n_sites": len(calc.sites),
+        "repeat": repeat,
+    }
+    return {"metadata": metadata, "results": results}
+
+
+def compare_benchmarks(benchmarks, baseline, max_slowdown):
+    """Compare benchmarks to a baseline.
+
+    Parameters
+    ----------
+    benchmarks : dict
+        Benchmarks returned by :func:`run_benchmarks`.
+    baseline : dict
+        Baseline benchmarks returned by :func:`run_benchmarks`.
+    max_slowdown : float
+        Benchmarks with a minimum time more than this many times the baseline
+        are flagged as regressions. The minimum rather than median time is
+        compared as it is least affected by noise from other load on the machine.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Gives the baseline and current minimum times, their ratio, and whether
+        each benchmark is a regression.
+
+    """
+    comparison = pd.DataFrame(
+        [
+            (name, baseline["results"][name]["min"], result["min"])
+            for name, result in benchmarks["results"].items()
+            if name in baseline["results"]
+        ],
+        columns=["benchmark", "baseline_seconds", "seconds"],
+    )
+    comparison["ratio"] = comparison["seconds"] / comparison["baseline_seconds"]
+    comparison["regression"] = comparison["ratio"] > max_slowdown
+    return comparison
+
+
+if __name__ == "__main__":
+
+    # Command line interface
+    parser = argparse.ArgumentParser(
+        description="Benchmark performance of the escape calculator."
+    )
+
+    parser.add_argument(
+        "--escape",
+        type=str,
+        default="results/escape.csv",
+        help="Path to the escape data.",
+    )
+
+    parser.add_argument(
+        "--antibody_ic50s",
+        type=str,
+        default="results/antibody_IC50s.csv",
+        help="Path to the antibody IC50s.",
+    )
+
+    parser.add_argument(
+        "--antibody_sources",
+        type=str,
+        default="results/antibody_sources.csv",
+        help="Path to the antibody sources.",
+    )
+
+    parser.add_argument(
+        "--antibody_reweighting",
+        type=str,
+        default="results/antibody_reweighting.csv",
+        help="Path to the antibody reweighting.",
+    )
+
+    parser.add_argument(
+        "--config",
+        type=str,
+        default="config.yaml",
+        help="Path to the configuration.",
+    )
+
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1000, 10000, 100000],
+        help="Numbers of synthetic sets of mutated sites to score in bulk.",
+    )
+
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="Number of times to time each benchmark.",
+    )
+
+    parser.add_argument(
+        "--save_baseline",
+        type=str,
+        required=False,
+        help="Path to a JSON file to save the benchmarks as a baseline.",
+    )
+
+    parser.add_argument(
+        "--compare",
+        type=str,
+        required=False,
+        help="Path to a JSON file with baseline benchmarks to compare against.",
+    )
+
+    parser.add_argument(
+        "--max_slowdown",
+        type=float,
+        default=1.5,
+        help="Exit with an error if a benchmark is this many times slower than baseline.",
+    )
+
+    args = parser.parse_args()
+
+    benchmarks = run_benchmarks(
+        args.escape,
+        args.antibody_ic50s,
+        args.antibody_sources,
+        args.antibody_reweighting,
+        args.config,
+        sizes=args.sizes,
+        repeat=args.repeat,
+        log=sys.stdout,
+    )
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(benchmarks, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for key, value in baseline["metadata"].items():
+            if benchmarks["metadata"].get(key) != value:
+                print(
+                    f"Note: {key} is {benchmarks['metadata'].get(key)} "
+                    f"but was {value} for baseline."
+                )
+        comparison = compare_benchmarks(benchmarks, baseline, args.max_slowdown)
+        print(comparison.to_string(index=False, float_format="{:.4g}".format))
+        if comparison["regression"].any():
+            sys.exit(
+                "Benchmarks more than "
+                f"{args.max_slowdown} times slower than baseline: "
+                + ", ".join(comparison.query("regression")["benchmark"])
+            )
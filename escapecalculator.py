@@ -47,9 +47,11 @@ First, create such a data frame of sequences:
 2  seq3         [440]
 3  seq4    [440, 505]
 
-Now apply the calculator:
+Now apply the calculator, which is fastest using
+:meth:`EscapeCalculator.binding_retained_many` as it scores all the sequences
+in one vectorized pass:
 
->>> seqs["neutralization retained"] = seqs["mutated sites"].map(calc.binding_retained)
+>>> seqs["neutralization retained"] = calc.binding_retained_many(seqs["mutated sites"])
 >>> seqs.round(3)
    name mutated sites  neutralization retained
 0  seq1            []                    1.000
@@ -72,7 +74,27 @@ Now the escape will be different because different antibodies neutralize that vi
 __docformat__ = 'numpy'
 
 
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import functools
+import hashlib
+import http.server
+import io
+import itertools
+import json
+import math
+import os
+import queue
+import re
+import sys
+import threading
+import time
+
 import requests
+import requests.adapters
+import urllib3.util
 
 import numpy
 
@@ -81,6 +103,701 @@ import pandas as pd
 import yaml
 
 
+DEFAULT_DATA = {
+    "escape": "https://raw.githubusercontent.com/jbloomlab/SARS2-RBD-escape-calc/main/results/escape.csv",
+    "antibody_ic50s": "https://raw.githubusercontent.com/jbloomlab/SARS2-RBD-escape-calc/main/results/antibody_IC50s.csv",
+    "antibody_sources": "https://raw.githubusercontent.com/jbloomlab/SARS2-RBD-escape-calc/main/results/antibody_sources.csv",
+    "antibody_reweighting": "https://raw.githubusercontent.com/jbloomlab/SARS2-RBD-escape-calc/main/results/antibody_reweighting.csv",
+    "config": "https://raw.githubusercontent.com/jbloomlab/SARS2-RBD-escape-calc/main/config.yaml",
+}
+"""URLs of the data used by default by :class:`EscapeCalculator`."""
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "ESCAPECALCULATOR_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "escapecalculator"),
+)
+"""Default directory for caching downloaded data, can be set by environment variable
+`ESCAPECALCULATOR_CACHE_DIR`."""
+
+
+HTTP_TIMEOUT = (10, 120)
+"""Connect and read timeouts in seconds for downloading data."""
+
+HTTP_RETRIES = 5
+"""Number of times to retry failed downloads, with exponential backoff."""
+
+_http_session = None
+_http_session_pid = None
+
+
+def _get_http_session():
+    """Get a session for downloading data that reuses connections and retries.
+
+    The session is created once per process, as connections cannot be shared by
+    forked processes.
+
+    """
+    global _http_session, _http_session_pid
+    if _http_session is None or _http_session_pid != os.getpid():
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            max_retries=urllib3.util.Retry(
+                total=HTTP_RETRIES,
+                backoff_factor=0.5,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=["GET"],
+            ),
+            pool_maxsize=len(DEFAULT_DATA),
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _http_session, _http_session_pid = session, os.getpid()
+    return _http_session
+
+
+def _read_inputs(paths_or_urls, cache_dir=None, offline=False):
+    """Read the contents of several input files, downloading URLs concurrently.
+
+    Parameters
+    ----------
+    paths_or_urls : list of str
+        Paths or URLs of the files.
+    cache_dir : None or str
+        Same meaning as for :func:`_read_input`.
+    offline : bool
+        Same meaning as for :func:`_read_input`.
+
+    Returns
+    -------
+    list of bytes
+        The contents of each file.
+
+    """
+    n_urls = sum(
+        path_or_url.startswith(("http://", "https://")) for path_or_url in paths_or_urls
+    )
+    if n_urls <= 1 or offline:
+        return [
+            _read_input(path_or_url, cache_dir, offline) for path_or_url in paths_or_urls
+        ]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=n_urls) as executor:
+        return list(
+            executor.map(
+                lambda path_or_url: _read_input(path_or_url, cache_dir, offline),
+                paths_or_urls,
+            )
+        )
+
+
+def _read_input(path_or_url, cache_dir=None, offline=False):
+    """Read the contents of an input file, which may be a URL cached on disk.
+
+    Downloaded URLs are cached in a content-addressed store in `cache_dir`: each file
+    is stored under its SHA-256 hash, which is checked whenever the file is read, and
+    an index entry for each URL gives the hash, ETag, and last modified time of the
+    file. Each URL has its own index entry file, written atomically, so processes
+    and threads sharing `cache_dir` never overwrite each other's entries. If
+    the URL has been cached, it is only downloaded again if the server reports it
+    has changed. Downloads use a shared session with :data:`HTTP_TIMEOUT` and
+    :data:`HTTP_RETRIES`.
+
+    Parameters
+    ----------
+    path_or_url : str
+        Path or URL of file.
+    cache_dir : None or str
+        If not `None`, cache downloaded URLs in this directory.
+    offline : bool
+        Never access the network, so URLs must already be in `cache_dir`.
+
+    Returns
+    -------
+    bytes
+        The contents of the file.
+
+    """
+    if not path_or_url.startswith(("http://", "https://")):
+        with open(path_or_url, "rb") as f:
+            return f.read()
+
+    if cache_dir is None:
+        if offline:
+            raise ValueError(f"cannot read {path_or_url} offline without a cache_dir")
+        response = _get_http_session().get(path_or_url, timeout=HTTP_TIMEOUT)
+        response.raise_for_status()
+        return response.content
+
+    entry = _read_cache_entry(path_or_url, cache_dir)
+    content = None
+    if entry is not None:
+        sha256 = entry["sha256"]
+        try:
+            with open(os.path.join(cache_dir, "objects", sha256), "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            pass
+        else:
+            if hashlib.sha256(content).hexdigest() != sha256:
+                content = None
+    if offline:
+        if content is None:
+            raise ValueError(f"{path_or_url} is not validly cached in {cache_dir=}")
+        return content
+
+    headers = {}
+    if content is not None and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if content is not None and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    response = _get_http_session().get(
+        path_or_url, headers=headers, timeout=HTTP_TIMEOUT
+    )
+    if response.status_code == 304:
+        return content
+    response.raise_for_status()
+    content = response.content
+    sha256 = hashlib.sha256(content).hexdigest()
+    _write_atomically(os.path.join(cache_dir, "objects", sha256), content)
+    _write_atomically(
+        _cache_entry_path(path_or_url, cache_dir),
+        json.dumps({
+            "url": path_or_url,
+            "sha256": sha256,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }, indent=2).encode(),
+    )
+    return content
+
+
+def _cache_entry_path(url, cache_dir):
+    """Path of the index entry for a URL cached in `cache_dir`."""
+    return os.path.join(
+        cache_dir, "index", hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json"
+    )
+
+
+def _read_cache_entry(url, cache_dir):
+    """Read the index entry for a URL cached in `cache_dir`, or `None` if not cached."""
+    try:
+        with open(_cache_entry_path(url, cache_dir)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _write_atomically(path, content):
+    """Write bytes to a file so other processes never see a partial file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+# keys of inputs (and calculator settings) that passed full validation in this process
+_validated = set()
+
+
+def _needs_validation(validation, key, cache_dir):
+    """Whether inputs with `key` need to be validated under a validation policy.
+
+    Under the "checksum" policy, inputs need validation unless they passed full
+    validation in this process or, if `cache_dir` is not `None`, are recorded as
+    validated in `cache_dir`.
+
+    """
+    if validation == "full":
+        return True
+    elif validation == "none":
+        return False
+    elif validation == "checksum":
+        if key in _validated:
+            return False
+        if cache_dir is not None and os.path.isfile(_validated_path(key, cache_dir)):
+            _validated.add(key)
+        return key not in _validated
+    else:
+        raise ValueError(f"invalid {validation=}")
+
+
+def _validated_path(key, cache_dir):
+    """Path of file recording that inputs with `key` passed full validation.
+
+    Each key has its own file so processes recording different keys at the same
+    time do not overwrite each other's records.
+
+    """
+    return os.path.join(
+        cache_dir, "validated", hashlib.sha256(key.encode("utf-8")).hexdigest()
+    )
+
+
+def _record_validated(key, cache_dir):
+    """Record that inputs with `key` passed full validation."""
+    _validated.add(key)
+    if cache_dir is not None and not os.path.isfile(_validated_path(key, cache_dir)):
+        _write_atomically(_validated_path(key, cache_dir), key.encode("utf-8"))
+
+
+def download_data(cache_dir=DEFAULT_CACHE_DIR, data=None):
+    """Download data into a cache so calculators can be created offline.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory in which to cache data.
+    data : None or dict
+        Maps names to URLs of data to download. If `None`, use :data:`DEFAULT_DATA`.
+
+    Example
+    -------
+    Populate the cache, then create a calculator that never accesses the network:
+
+    >>> import tempfile
+    >>> cache_dir = tempfile.mkdtemp()
+    >>> download_data(cache_dir)
+    >>> calc = EscapeCalculator(cache_dir=cache_dir, offline=True)
+    >>> float(calc.binding_retained([440, 505]).round(3))
+    0.408
+
+    """
+    if data is None:
+        data = DEFAULT_DATA
+    _read_inputs(list(data.values()), cache_dir=cache_dir)
+
+
+INPUT_DTYPES = {
+    "antibody": "category",
+    "site": "int16",
+    "escape": "float64",
+    "virus": "category",
+    "IC50": "float64",
+    "source": "category",
+    "study": "category",
+    "reweight": "float64",
+}
+"""Data types of the columns of the input CSVs. Strings are categorical to save memory
+and speed up filtering and merging, and numbers are double precision so results
+exactly match the interactive calculator."""
+
+
+CacheInfo = collections.namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+"""Statistics on the cache of an :class:`EscapeCalculator`."""
+
+
+class Instrumentation:
+    """Timings of the phases of reading data and of calls to calculators.
+
+    Nothing is timed by default. To time an :class:`EscapeData` or
+    :class:`EscapeCalculator`, pass an :class:`Instrumentation` as its
+    `instrumentation`. The same :class:`Instrumentation` can be shared by several
+    calculators to accumulate their timings.
+
+    The phases of reading data are "fetch" (reading or downloading the input
+    files), "parse", "validate", and "merge" for :class:`EscapeData`, and "filter"
+    and "index" (building the escape matrix) for :class:`EscapeCalculator`. Calls
+    to the scoring methods of :class:`EscapeCalculator` are counted and timed with
+    a histogram of their latencies. When scoring with multiple processes using
+    :meth:`EscapeCalculator.score_parallel`, calls made in worker processes are
+    not recorded.
+
+    Parameters
+    ----------
+    logger : None or logging.Logger
+        If not `None`, log each phase and call to this logger at `logging.DEBUG`
+        level.
+
+    Example
+    -------
+    >>> instrumentation = Instrumentation()
+    >>> calc = EscapeCalculator(instrumentation=instrumentation)
+    >>> _ = calc.binding_retained([440, 505])
+    >>> timings = instrumentation.to_dict()
+    >>> sorted(timings["phases"])
+    ['fetch', 'filter', 'index', 'merge', 'parse', 'validate']
+    >>> timings["calls"]["binding_retained"]["count"]
+    1
+
+    """
+
+    latency_buckets = (1e-4, 1e-3, 1e-2, 1e-1, 1, 10, math.inf)
+    """Upper bounds in seconds of the buckets of the histograms of call latencies."""
+
+    def __init__(self, logger=None):
+        """See main class docstring."""
+        self.logger = logger
+        self._lock = threading.Lock()
+        self.reset()
+
+    def __getstate__(self):
+        """Get state for pickling, which cannot include the lock."""
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        """Set state when unpickling."""
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Clear all timings."""
+        with self._lock:
+            self._phases = {}
+            self._calls = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Context manager that times a phase, accumulating repeated phases.
+
+        Parameters
+        ----------
+        name : str
+            Name of the phase.
+
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                count, total = self._phases.get(name, (0, 0.0))
+                self._phases[name] = (count + 1, total + seconds)
+            if self.logger is not None:
+                self.logger.debug("phase %s took %.6f seconds", name, seconds)
+
+    def record_call(self, name, seconds):
+        """Record a call.
+
+        Parameters
+        ----------
+        name : str
+            Name of the called method.
+        seconds : float
+            Duration of the call.
+
+        """
+        with self._lock:
+            if name not in self._calls:
+                self._calls[name] = [0, 0.0, [0] * len(self.latency_buckets)]
+            call = self._calls[name]
+            call[0] += 1
+            call[1] += seconds
+            call[2][
+                next(i for i, bound in enumerate(self.latency_buckets) if seconds <= bound)
+            ] += 1
+        if self.logger is not None:
+            self.logger.debug("call %s took %.6f seconds", name, seconds)
+
+    def to_dict(self):
+        """Get the timings.
+
+        Returns
+        -------
+        dict
+            Has keys "phases" and "calls". "phases" gives the number of times and
+            total seconds of each phase. "calls" gives the number of calls, total
+            seconds, and a histogram (the number of calls taking at most each of
+            :attr:`Instrumentation.latency_buckets` seconds, but more than the
+            previous bucket) for each scoring method.
+
+        """
+        with self._lock:
+            return {
+                "phases": {
+                    name: {"count": count, "seconds": seconds}
+                    for name, (count, seconds) in self._phases.items()
+                },
+                "calls": {
+                    name: {
+                        "count": count,
+                        "seconds": seconds,
+                        "histogram": {
+                            f"{bound:g}": n
+                            for bound, n in zip(self.latency_buckets, histogram)
+                        },
+                    }
+                    for name, (count, seconds, histogram) in self._calls.items()
+                },
+            }
+
+    def to_json(self, **kwargs):
+        """Get the timings as JSON.
+
+        Parameters
+        ----------
+        **kwargs
+            Keyword arguments for `json.dumps`.
+
+        Returns
+        -------
+        str
+            JSON of :meth:`Instrumentation.to_dict`.
+
+        """
+        return json.dumps(self.to_dict(), **kwargs)
+
+
+def _phase(instrumentation, name):
+    """Context manager timing a phase if `instrumentation` is not `None`."""
+    if instrumentation is None:
+        return contextlib.nullcontext()
+    return instrumentation.phase(name)
+
+
+def _instrumented(method):
+    """Decorate a calculator method to record its calls to its instrumentation."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.instrumentation is None:
+            return method(self, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.instrumentation.record_call(
+                method.__name__, time.perf_counter() - start
+            )
+
+    return wrapper
+
+
+class EscapeData:
+    """Input data for escape calculations, read and validated once.
+
+    Creating an :class:`EscapeCalculator` reads, merges, and validates all the input
+    data. To create calculators for several settings (such as different viruses),
+    first create an :class:`EscapeData` and then create calculators from it with
+    :meth:`EscapeData.calculator`, which shares the already loaded data.
+
+    Parameters
+    ----------
+    escape : str
+        Path or URL of CSV containing the escape data.
+    antibody_ic50s : str
+        Path or URL of CSV containing the antibody IC50s.
+    antibody_sources : str
+        Path or URL of CSV containing the antibody sources.
+    antibody_reweighting : str
+        Path or URL of CSV containing the antibody reweightings.
+    config : str
+        Path or URL of YAML file containing initial settings.
+    cache_dir : None or str
+        Same meaning as for :class:`EscapeCalculator`.
+    offline : bool
+        Same meaning as for :class:`EscapeCalculator`.
+    instrumentation : None or Instrumentation
+        Same meaning as for :class:`EscapeCalculator`.
+    validation : {"full", "checksum", "none"}
+        Same meaning as for :class:`EscapeCalculator`.
+
+    Attributes
+    ----------
+    escape : pandas.DataFrame
+        The escape data.
+    antibody_ic50s : pandas.DataFrame
+        The antibody IC50s.
+    antibody_sources : pandas.DataFrame
+        The antibody sources.
+    antibody_reweighting : pandas.DataFrame
+        The antibody reweightings.
+    data : pandas.DataFrame
+        The merged data.
+    config : dict
+        The initial settings.
+    digest : str
+        SHA-256 digest of the contents of all the input files.
+
+    Example
+    -------
+    >>> escape_data = EscapeData()
+    >>> calc = escape_data.calculator(virus="BA.2")
+    >>> float(calc.binding_retained([440, 505]).round(3))
+    0.59
+
+    """
+    def __init__(self,
+        escape=DEFAULT_DATA["escape"],
+        antibody_ic50s=DEFAULT_DATA["antibody_ic50s"],
+        antibody_sources=DEFAULT_DATA["antibody_sources"],
+        antibody_reweighting=DEFAULT_DATA["antibody_reweighting"],
+        config=DEFAULT_DATA["config"],
+        *,
+        cache_dir=None,
+        offline=False,
+        instrumentation=None,
+        validation="full",
+    ):
+        """See main class docstring."""
+        if validation not in {"full", "checksum", "none"}:
+            raise ValueError(f"invalid {validation=}")
+        self.instrumentation = instrumentation
+        self.validation = validation
+        self._cache_dir = cache_dir
+
+        # read input data
+        with _phase(instrumentation, "fetch"):
+            contents = _read_inputs(
+                [escape, antibody_ic50s, antibody_sources, antibody_reweighting, config],
+                cache_dir,
+                offline,
+            )
+        with _phase(instrumentation, "parse"):
+            (
+                self.escape,
+                self.antibody_ic50s,
+                self.antibody_sources,
+                self.antibody_reweighting,
+            ) = [
+                pd.read_csv(io.BytesIO(content), dtype=INPUT_DTYPES)
+                for content in contents[:4]
+            ]
+            self.config = yaml.safe_load(contents[4].decode("utf-8"))
+
+            # use the same categories for antibodies in all tables for fast merges
+            antibody_dtype = pd.CategoricalDtype(
+                sorted(
+                    set().union(*[
+                        df["antibody"].cat.categories
+                        for df in [
+                            self.escape,
+                            self.antibody_ic50s,
+                            self.antibody_sources,
+                            self.antibody_reweighting,
+                        ]
+                    ])
+                )
+            )
+            for df in [
+                self.escape,
+                self.antibody_ic50s,
+                self.antibody_sources,
+                self.antibody_reweighting,
+            ]:
+                df["antibody"] = df["antibody"].astype(antibody_dtype)
+        self.digest = hashlib.sha256(
+            b"".join(hashlib.sha256(content).digest() for content in contents)
+        ).hexdigest()
+
+        # the checks are skipped if these data already passed full validation
+        validate = _needs_validation(validation, self.digest, cache_dir)
+        with _phase(instrumentation, "validate"):
+            if validate:
+                self._validate_inputs()
+
+        with _phase(instrumentation, "merge"):
+            self.data = (
+                self.escape
+                .merge(self.antibody_ic50s, on="antibody")
+                .merge(self.antibody_sources, on="antibody")
+                .merge(self.antibody_reweighting, on="antibody", how="left")
+                .assign(reweight=lambda x: x["reweight"].fillna(1))
+            )
+
+        with _phase(instrumentation, "validate"):
+            if validate:
+                assert self.data.notnull().all().all()
+                assert set(self.data["study"]) == set(self.config["studies"])
+                _record_validated(self.digest, cache_dir)
+
+    def _validate_inputs(self):
+        """Validate the input data."""
+        assert set(self.escape.columns) == {"antibody", "site", "escape"}
+        assert len(self.escape) == len(
+            self.escape.groupby(["antibody", "site", "escape"], observed=True)
+        )
+        assert self.escape.notnull().all().all()
+        antibodies = set(self.escape["antibody"])
+
+        assert set(self.antibody_ic50s.columns) == {"antibody", "virus", "IC50"}
+        assert (
+            len(self.antibody_ic50s)
+            == len(
+                self.antibody_ic50s.groupby(["antibody", "virus", "IC50"], observed=True)
+            )
+        )
+        assert self.antibody_ic50s["IC50"].max() == 10
+        assert antibodies == set(self.antibody_ic50s["antibody"])
+
+        assert set(self.antibody_sources.columns) == {"antibody", "source", "study"}
+        assert (
+            len(self.antibody_sources)
+            == len(
+                self.antibody_sources.groupby(
+                    ["antibody", "source", "study"], observed=True
+                )
+            )
+            == len(antibodies)
+        )
+        assert antibodies == set(self.antibody_sources["antibody"])
+
+        assert set(self.antibody_reweighting.columns) == {"antibody", "reweight"}
+        assert antibodies.issuperset(self.antibody_reweighting["antibody"])
+
+    def calculator(self, **kwargs):
+        """Create a calculator that uses these data.
+
+        Parameters
+        ----------
+        **kwargs
+            Keyword arguments for :class:`EscapeCalculator` other than those
+            specifying the input data. By default, `instrumentation` and
+            `validation` are those of these data.
+
+        Returns
+        -------
+        EscapeCalculator
+
+        """
+        kwargs.setdefault("instrumentation", self.instrumentation)
+        kwargs.setdefault("validation", self.validation)
+        return EscapeCalculator(escape_data=self, **kwargs)
+
+    def binding_retained_by_virus(self, mutated_sites, viruses=None, **kwargs):
+        """Fraction binding or neutralization retained relative to each of several viruses.
+
+        Parameters
+        ----------
+        mutated_sites : array-like of array-likes of integers
+            Each entry is a list of mutated sites, as for
+            :meth:`EscapeCalculator.binding_retained_many`.
+        viruses : None or list
+            Compute binding retained relative to these viruses. If `None`, use all
+            viruses with IC50s.
+        **kwargs
+            Other keyword arguments for :meth:`EscapeData.calculator`.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Has a row for each entry in `mutated_sites` and a column for each virus.
+
+        Example
+        -------
+        >>> escape_data = EscapeData()
+        >>> escape_data.binding_retained_by_virus(
+        ...     [[440, 505]], viruses=["KP.3", "BA.2"]
+        ... ).round(3)
+        virus   KP.3  BA.2
+        0      0.408  0.59
+
+        """
+        if viruses is None:
+            viruses = sorted(self.antibody_ic50s["virus"].unique())
+        mutated_sites = list(mutated_sites)
+        return pd.DataFrame(
+            {
+                virus: self.calculator(virus=virus, **kwargs).binding_retained_many(
+                    mutated_sites
+                )
+                for virus in viruses
+            }
+        ).rename_axis(columns="virus")
+
+
 class EscapeCalculator:
     """Calculates residual polyclonal antibody binding after some mutations.
 
@@ -115,6 +832,30 @@ class EscapeCalculator:
         If not `None`, override default `init_sources` in `config`.
     reweight : None or bool
         If not `None`, override default `init_reweight` in `config`.
+    cache_size : int
+        Cache the results of :meth:`EscapeCalculator.binding_retained` and
+        :meth:`EscapeCalculator.escape_per_site` for up to this many sets of
+        mutated sites, evicting the least recently used. If 0, no caching.
+    cache_dir : None or str
+        If not `None`, cache input data downloaded from URLs in this directory,
+        such as :data:`DEFAULT_CACHE_DIR`. Cached files are validated by their
+        hash, and only downloaded again if the server reports they changed.
+    offline : bool
+        Never access the network, so input URLs must already be cached in
+        `cache_dir`, for instance using :func:`download_data`.
+    escape_data : None or EscapeData
+        If not `None`, use these already loaded data rather than reading the data
+        specified by `escape`, `antibody_ic50s`, `antibody_sources`,
+        `antibody_reweighting`, `config`, `cache_dir`, and `offline`.
+    instrumentation : None or Instrumentation
+        If not `None`, record timings of reading the data and of calls to the
+        scoring methods.
+    validation : {"full", "checksum", "none"}
+        How to validate the input data. If "full", run all checks on the data, and
+        record that data with this digest (and settings) passed (in memory, and in
+        `cache_dir` if it is not `None`). If "checksum", skip the expensive checks
+        if data with the same digest (and settings) already passed full validation.
+        If "none", skip the expensive checks.
 
     Example
     -------
@@ -165,11 +906,11 @@ class EscapeCalculator:
 
     """
     def __init__(self,
-        escape="https://raw.githubusercontent.com/jbloomlab/SARS2-RBD-escape-calc/main/results/escape.csv",
-        antibody_ic50s="https://raw.githubusercontent.com/jbloomlab/SARS2-RBD-escape-calc/main/results/antibody_IC50s.csv",
-        antibody_sources="https://raw.githubusercontent.com/jbloomlab/SARS2-RBD-escape-calc/main/results/antibody_sources.csv",
-        antibody_reweighting="https://raw.githubusercontent.com/jbloomlab/SARS2-RBD-escape-calc/main/results/antibody_reweighting.csv",
-        config="https://raw.githubusercontent.com/jbloomlab/SARS2-RBD-escape-calc/main/config.yaml",
+        escape=DEFAULT_DATA["escape"],
+        antibody_ic50s=DEFAULT_DATA["antibody_ic50s"],
+        antibody_sources=DEFAULT_DATA["antibody_sources"],
+        antibody_reweighting=DEFAULT_DATA["antibody_reweighting"],
+        config=DEFAULT_DATA["config"],
         *,
         mut_escape_strength=None,
         weight_by_neg_log_ic50=None,
@@ -177,58 +918,73 @@ class EscapeCalculator:
         virus=None,
         sources=None,
         reweight=None,
+        cache_size=0,
+        cache_dir=None,
+        offline=False,
+        escape_data=None,
+        instrumentation=None,
+        validation="full",
     ):
         """See main class docstring."""
-        # read input data 
-        self.escape = pd.read_csv(escape)
-        assert set(self.escape.columns) == {"antibody", "site", "escape"}
-        assert len(self.escape) == len(self.escape.groupby(["antibody", "site", "escape"]))
-        assert self.escape.notnull().all().all()
-        antibodies = set(self.escape["antibody"])
-
-        self.antibody_ic50s = pd.read_csv(antibody_ic50s)
-        assert set(self.antibody_ic50s.columns) == {"antibody", "virus", "IC50"}
-        assert (
-            len(self.antibody_ic50s)
-            == len(self.antibody_ic50s.groupby(["antibody", "virus", "IC50"]))
-        )
-        assert self.antibody_ic50s["IC50"].max() == 10
-        assert antibodies == set(self.antibody_ic50s["antibody"])
-
-        self.antibody_sources = pd.read_csv(antibody_sources)
-        assert set(self.antibody_sources.columns) == {"antibody", "source", "study"}
-        assert (
-            len(self.antibody_sources)
-            == len(self.antibody_sources.groupby(["antibody", "source", "study"]))
-            == len(antibodies)
-        )
-        assert antibodies == set(self.antibody_sources["antibody"])
-
-        self.antibody_reweighting = pd.read_csv(antibody_reweighting)
-        assert set(self.antibody_reweighting.columns) == {"antibody", "reweight"}
-        assert antibodies.issuperset(self.antibody_reweighting["antibody"])
+        self.instrumentation = instrumentation
+        if escape_data is None:
+            escape_data = EscapeData(
+                escape,
+                antibody_ic50s,
+                antibody_sources,
+                antibody_reweighting,
+                config,
+                cache_dir=cache_dir,
+                offline=offline,
+                instrumentation=instrumentation,
+                validation=validation,
+            )
+        with _phase(instrumentation, "filter"):
+            self._init_settings(
+                escape_data,
+                mut_escape_strength,
+                weight_by_neg_log_ic50,
+                study,
+                virus,
+                sources,
+                reweight,
+            )
+        self._init_cache(cache_size)
 
-        self.data = (
-            self.escape
-            .merge(self.antibody_ic50s, on="antibody")
-            .merge(self.antibody_sources, on="antibody")
-            .merge(self.antibody_reweighting, on="antibody", how="left")
-            .assign(reweight=lambda x: x["reweight"].fillna(1))
+        # the checks of the filtered data depend on the data and the settings
+        key = json.dumps(
+            [escape_data.digest, self.study, self.virus, sorted(self.sources)]
         )
-        assert self.data.notnull().all().all()
+        if _needs_validation(validation, key, escape_data._cache_dir):
+            with _phase(instrumentation, "validate"):
+                self._validate_data()
+                _record_validated(key, escape_data._cache_dir)
+
+        with _phase(instrumentation, "index"):
+            self._init_index()
+
+    def _init_settings(
+        self,
+        escape_data,
+        mut_escape_strength,
+        weight_by_neg_log_ic50,
+        study,
+        virus,
+        sources,
+        reweight,
+    ):
+        """Initialize the settings and filter the data for them."""
+        self.escape = escape_data.escape
+        self.antibody_ic50s = escape_data.antibody_ic50s
+        self.antibody_sources = escape_data.antibody_sources
+        self.antibody_reweighting = escape_data.antibody_reweighting
+        self.data = escape_data.data
 
         # get initial config
-        if config.startswith("http"):
-            response = requests.get(config, allow_redirects=True)
-            config_text = response.content.decode("utf-8")
-        else:
-            with open(config) as f:
-                config_text = f.read()
-        config = yaml.safe_load(config_text)
+        config = escape_data.config
         self.sites = set(range(config["sites"]["start"], config["sites"]["end"] + 1))
         studies = config["studies"]
         studies_rev = {value: key for (key, value) in studies.items()}
-        assert set(self.data["study"]) == set(studies)
 
         if mut_escape_strength is None:
             self.mut_escape_strength = config["init_mutation_escape_strength"]
@@ -275,33 +1031,293 @@ class EscapeCalculator:
             self.reweight = reweight
         assert isinstance(self.reweight, bool), self.reweight
 
-        # filter data
+        # filter data with a single mask, comparing the categorical columns
+        keep = self.data["source"].isin(self.sources)
         if self.study != "any":
             assert self.study in set(self.data["study"])
-            self.data = self.data.query("study == @self.study").drop(columns="study")
-        else:
-            self.data = self.data.drop(columns="study")
-
+            keep &= self.data["study"] == self.study
         assert self.virus in set(self.data["virus"])
-        self.data = self.data.query("virus == @self.virus").drop(columns="virus")
-
-        self.data = self.data.query("source in @self.sources").drop(columns="source")
+        keep &= self.data["virus"] == self.virus
+        self.data = self.data[keep].drop(columns=["study", "virus", "source"])
 
         assert set(self.data.columns) == {"antibody", "site", "escape", "IC50", "reweight"}
-        assert len(self.data) == len(self.data.drop_duplicates())
         self.data = (
             self.data
             .assign(neg_log_ic50=lambda x: -numpy.log(x["IC50"] / 10))
             .drop(columns="IC50")
         )
 
+    def _validate_data(self):
+        """Validate the filtered data."""
+        assert len(self.data) == len(self.data.drop_duplicates())
+
         max_escape_per_antibody = (
             self.data
-            .groupby("antibody")
+            .groupby("antibody", observed=True)
             .aggregate(max_escape=pd.NamedAgg("escape", "max"))
         )
         assert (max_escape_per_antibody["max_escape"] == 1).all()
 
+        assert (
+            self.data[["antibody", "neg_log_ic50", "reweight"]]
+            .drop_duplicates()["antibody"]
+            .is_unique
+        )
+        assert not self.data.duplicated(["antibody", "site"]).any()
+
+    def _init_index(self):
+        """Initialize the escape matrix and arrays from the filtered data."""
+        # store the escape as a sparse antibody x site matrix (see `_init_arrays`)
+        # so the calculations only need to use the entries at mutated sites
+        antibody_data = (
+            self.data[["antibody", "neg_log_ic50", "reweight"]]
+            .drop_duplicates()
+            .sort_values("antibody")
+        )
+        self._antibodies = antibody_data["antibody"].to_numpy()
+        self._neg_log_ic50 = antibody_data["neg_log_ic50"].to_numpy(dtype=float)
+        self._reweight = antibody_data["reweight"].to_numpy(dtype=float)
+        self._matrix_sites = numpy.union1d(
+            sorted(self.sites), self.data["site"].unique()
+        ).astype(int)
+        self._init_sparse_escape(
+            pd.Index(self._antibodies).get_indexer(self.data["antibody"]),
+            pd.Index(self._matrix_sites).get_indexer(self.data["site"]),
+            self.data["escape"].to_numpy(dtype=float),
+        )
+        self._init_arrays()
+
+    def _init_cache(self, cache_size):
+        """Initialize the cache of results for sets of mutated sites."""
+        if cache_size < 0:
+            raise ValueError(f"invalid {cache_size=}")
+        self.cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        self._cache_hits = self._cache_misses = 0
+        self._cache_lock = threading.Lock()
+
+    def __getstate__(self):
+        """Get state for pickling, which cannot include the lock."""
+        state = self.__dict__.copy()
+        del state["_cache_lock"]
+        return state
+
+    def __setstate__(self, state):
+        """Set state when unpickling."""
+        self.__dict__.update(state)
+        self._cache_lock = threading.Lock()
+
+    def _init_sparse_escape(self, antibody_index, column, escape):
+        """Initialize the sparse antibody x site escape matrix.
+
+        The matrix is in compressed sparse column format: the entries for the site
+        in column `i` of `self._matrix_sites` are at positions `self._site_ptr[i]`
+        to `self._site_ptr[i + 1]` of `self._entry_antibody` (which gives the index
+        of the antibody in `self._antibodies`) and `self._entry_escape`.
+
+        """
+        order = numpy.lexsort((antibody_index, column))
+        self._entry_antibody = antibody_index[order]
+        self._entry_escape = escape[order]
+        self._site_ptr = numpy.concatenate([
+            [0],
+            numpy.cumsum(numpy.bincount(column, minlength=len(self._matrix_sites))),
+        ])
+
+    def _init_arrays(self):
+        """Initialize arrays derived from the sparse antibody x site escape matrix."""
+        self._weights = numpy.ones(len(self._antibodies))
+        if self.weight_by_neg_log_ic50:
+            self._weights = self._weights * self._neg_log_ic50
+        if self.reweight:
+            self._weights = self._weights * self._reweight
+        self._weights_sum = self._weights.sum()
+
+        self._site_column = {site: i for i, site in enumerate(self._matrix_sites)}
+        self._entry_column = numpy.repeat(
+            numpy.arange(len(self._matrix_sites)), numpy.diff(self._site_ptr)
+        )
+
+        # get the log binding retained for each entry; the log of complete escape
+        # is -infinity, so use a large finite negative number that stays finite
+        # when summed and is zero binding retained when exponentiated
+        self._entry_full_escape = self._entry_escape >= 1
+        with numpy.errstate(divide="ignore"):
+            self._entry_log_bind_retain = numpy.maximum(
+                numpy.log(1 - self._entry_escape), -1e300
+            )
+
+        # weighted escape for each entry, and summed at each site
+        self._entry_weighted_escape = (
+            self._weights[self._entry_antibody] * self._entry_escape
+        )
+        self._original_escape = numpy.bincount(
+            self._entry_column,
+            weights=self._entry_weighted_escape,
+            minlength=len(self._matrix_sites),
+        ) / len(self._antibodies)
+
+        # columns of the sparse matrix for sites with escape
+        self._has_escape = numpy.diff(self._site_ptr) > 0
+
+        # for scoring many sets of mutated sites, index sites in sorted `self.sites`
+        # and get their columns in the sparse matrix; an extra last entry for
+        # padding site indices points to an empty column
+        self._sites_list = sorted(self.sites)
+        self._sites_index = {site: i for i, site in enumerate(self._sites_list)}
+        self._sites_ptr_start = self._site_ptr[
+            [self._site_column[site] for site in self._sites_list] + [0]
+        ]
+        self._sites_ptr_end = self._site_ptr[
+            [self._site_column[site] + 1 for site in self._sites_list] + [0]
+        ]
+
+    @functools.cached_property
+    def _weighted_escape(self):
+        """Dense antibody x site matrix of weighted escape divided by the number of
+        antibodies at sites with escape, for `escape_per_site_many`.
+
+        It is much larger than the sparse matrix, so it is only built when first used.
+
+        """
+        entries = numpy.flatnonzero(self._has_escape[self._entry_column])
+        weighted_escape = numpy.zeros((len(self._antibodies), self._has_escape.sum()))
+        weighted_escape[
+            self._entry_antibody[entries],
+            numpy.cumsum(self._has_escape)[self._entry_column[entries]] - 1,
+        ] = self._entry_weighted_escape[entries] / len(self._antibodies)
+        return weighted_escape
+
+    def _site_entries(self, site_indices):
+        """Positions of the sparse matrix entries for sites.
+
+        Parameters
+        ----------
+        site_indices : numpy.ndarray
+            Indices of sites in sorted `self.sites`, or `len(self.sites)` for no site.
+
+        Returns
+        -------
+        tuple
+            The positions of all the entries, and the index in `site_indices` of
+            the site for each entry.
+
+        """
+        starts = self._sites_ptr_start[site_indices]
+        lengths = self._sites_ptr_end[site_indices] - starts
+        site_of_entry = numpy.repeat(numpy.arange(len(site_indices)), lengths)
+        entries = (
+            numpy.arange(lengths.sum())
+            + numpy.repeat(starts - numpy.cumsum(lengths) + lengths, lengths)
+        )
+        return entries, site_of_entry
+
+    def save_snapshot(self, path):
+        """Save the calculator to a binary snapshot file.
+
+        The snapshot contains the sparse antibody x site escape matrix and the
+        antibody weights, so :meth:`EscapeCalculator.from_snapshot` can re-create the
+        calculator without reading, merging, and validating the input data.
+
+        Parameters
+        ----------
+        path : str
+            Name of the snapshot file, which is in NumPy ``.npz`` format.
+
+        """
+        metadata = {
+            "snapshot_version": 2,
+            "sites": sorted(self.sites),
+            "mut_escape_strength": self.mut_escape_strength,
+            "weight_by_neg_log_ic50": self.weight_by_neg_log_ic50,
+            "study": self.study,
+            "virus": self.virus,
+            "sources": sorted(self.sources),
+            "reweight": self.reweight,
+        }
+        with open(path, "wb") as f:
+            numpy.savez(
+                f,
+                metadata=numpy.array(json.dumps(metadata)),
+                antibodies=self._antibodies.astype(str),
+                neg_log_ic50=self._neg_log_ic50,
+                reweight=self._reweight,
+                matrix_sites=self._matrix_sites,
+                site_ptr=self._site_ptr,
+                entry_antibody=self._entry_antibody,
+                entry_escape=self._entry_escape,
+            )
+
+    @classmethod
+    def from_snapshot(cls, path, *, cache_size=0, instrumentation=None):
+        """Create a calculator from a snapshot file.
+
+        The raw input tables are not in the snapshot, so the :attr:`escape`,
+        :attr:`antibody_ic50s`, :attr:`antibody_sources`, and
+        :attr:`antibody_reweighting` attributes of the created calculator are `None`.
+
+        Parameters
+        ----------
+        path : str
+            Snapshot file created by :meth:`EscapeCalculator.save_snapshot`.
+        cache_size : int
+            Same meaning as for :class:`EscapeCalculator`.
+        instrumentation : None or Instrumentation
+            Same meaning as for :class:`EscapeCalculator`.
+
+        Returns
+        -------
+        EscapeCalculator
+
+        Example
+        -------
+        >>> import os
+        >>> import tempfile
+        >>> snapshot = os.path.join(tempfile.mkdtemp(), "calc.npz")
+        >>> EscapeCalculator().save_snapshot(snapshot)
+        >>> calc = EscapeCalculator.from_snapshot(snapshot)
+        >>> float(calc.binding_retained([440, 505]).round(3))
+        0.408
+
+        """
+        with _phase(instrumentation, "fetch"), numpy.load(path) as snapshot:
+            metadata = json.loads(snapshot["metadata"].item())
+            if metadata["snapshot_version"] != 2:
+                raise ValueError(f"unsupported {metadata['snapshot_version']=}")
+            arrays = {key: snapshot[key] for key in snapshot.files if key != "metadata"}
+
+        calc = cls.__new__(cls)
+        calc.instrumentation = instrumentation
+        calc.escape = calc.antibody_ic50s = None
+        calc.antibody_sources = calc.antibody_reweighting = None
+        calc.sites = set(metadata["sites"])
+        calc.mut_escape_strength = metadata["mut_escape_strength"]
+        calc.weight_by_neg_log_ic50 = metadata["weight_by_neg_log_ic50"]
+        calc.study = metadata["study"]
+        calc.virus = metadata["virus"]
+        calc.sources = set(metadata["sources"])
+        calc.reweight = metadata["reweight"]
+        calc._init_cache(cache_size)
+
+        calc._antibodies = arrays["antibodies"].astype(object)
+        calc._neg_log_ic50 = arrays["neg_log_ic50"]
+        calc._reweight = arrays["reweight"]
+        calc._matrix_sites = arrays["matrix_sites"]
+        calc._site_ptr = arrays["site_ptr"]
+        calc._entry_antibody = arrays["entry_antibody"]
+        calc._entry_escape = arrays["entry_escape"]
+        with _phase(instrumentation, "index"):
+            calc._init_arrays()
+            calc.data = pd.DataFrame({
+                "antibody": calc._antibodies[calc._entry_antibody],
+                "site": calc._matrix_sites[calc._entry_column],
+                "escape": calc._entry_escape,
+                "reweight": calc._reweight[calc._entry_antibody],
+                "neg_log_ic50": calc._neg_log_ic50[calc._entry_antibody],
+            })
+        return calc
+
+    @_instrumented
     def escape_per_site(self, mutated_sites):
         """Escape at each site after mutating indicated sites.
 
@@ -320,37 +1336,25 @@ class EscapeCalculator:
         mutated_sites = set(mutated_sites)
         if not mutated_sites.issubset(self.sites):
             raise ValueError(f"sites {mutated_sites - self.sites} not in {self.sites}")
-        df = (
-            self.data
-            .assign(
-                mutated=lambda x: x['site'].isin(mutated_sites).astype(int),
-                site_bind_retain=lambda x: 1 - x["escape"] * x["mutated"],
-            )
-            .groupby(["antibody", "neg_log_ic50", "reweight"], as_index=False)
-            .aggregate(antibody_bind_retain=pd.NamedAgg("site_bind_retain", "prod"))
-            .assign(
-                antibody_bind_retain=lambda x: x["antibody_bind_retain"].pow(
-                    self.mut_escape_strength
-                ),
-                weight=lambda x: (
-                    (x["neg_log_ic50"] if self.weight_by_neg_log_ic50 else 1)
-                    * (x["reweight"] if self.reweight else 1)
-                ),
-            )
-            [["antibody", "antibody_bind_retain", "weight"]]
-            .merge(self.data[["antibody", "site", "escape"]])
-            .assign(
-                escape=lambda x: x["escape"] * x["weight"],
-                retained_escape=lambda x: x["antibody_bind_retain"] * x["escape"],
-            )
-            .groupby("site")
-            .aggregate(
-                original_escape=pd.NamedAgg("escape", "sum"),
-                retained_escape=pd.NamedAgg("retained_escape", "sum"),
-            )
-        ) / self.data["antibody"].nunique()
-        return df.reset_index()
-
+        return self._cached(self._escape_per_site, mutated_sites).copy()
+
+    def _escape_per_site(self, mutated_sites):
+        """Escape at each site after mutating a valid set of sites."""
+        retained_escape = numpy.bincount(
+            self._entry_column,
+            weights=(
+                self._entry_weighted_escape
+                * self._antibody_bind_retain(mutated_sites)[self._entry_antibody]
+            ),
+            minlength=len(self._matrix_sites),
+        ) / len(self._antibodies)
+        return pd.DataFrame({
+            "site": self._matrix_sites[self._has_escape],
+            "original_escape": self._original_escape[self._has_escape],
+            "retained_escape": retained_escape[self._has_escape],
+        })
+
+    @_instrumented
     def binding_retained(self, mutated_sites):
         """Fraction binding or neutralization retained after mutating indicated sites.
 
@@ -368,32 +1372,1675 @@ class EscapeCalculator:
         mutated_sites = set(mutated_sites)
         if not mutated_sites.issubset(self.sites):
             raise ValueError(f"sites {mutated_sites - self.sites} not in {self.sites}")
-        retained = (
-            self.data
-            .assign(
-                mutated=lambda x: x["site"].isin(mutated_sites).astype(int),
-                site_bind_retain=lambda x: 1 - x["escape"] * x["mutated"],
-            )
-            .groupby(["antibody", "neg_log_ic50", "reweight"], as_index=False)
-            .aggregate(antibody_bind_retain=pd.NamedAgg("site_bind_retain", "prod"))
-            .assign(
-                antibody_bind_retain=lambda x: x["antibody_bind_retain"].pow(
-                    self.mut_escape_strength
-                ),
-                weight=lambda x: (
-                    (x["neg_log_ic50"] if self.weight_by_neg_log_ic50 else 1)
-                    * (x["reweight"] if self.reweight else 1)
-                ),
-                weighted_antibody_bind_retain=lambda x: (
-                    x["antibody_bind_retain"] * x["weight"]
-                ),
+        return self._cached(self._binding_retained, mutated_sites)
+
+    def _binding_retained(self, mutated_sites):
+        """Fraction binding retained after mutating a valid set of sites."""
+        return (
+            (self._antibody_bind_retain(mutated_sites) * self._weights).sum()
+            / self._weights_sum
+        )
+
+    def _antibody_bind_retain(self, mutated_sites):
+        """Binding retained by each antibody after mutating a valid set of sites."""
+        entries, _ = self._site_entries(
+            numpy.array([self._sites_index[site] for site in mutated_sites], dtype=int)
+        )
+        return numpy.exp(
+            self.mut_escape_strength
+            * numpy.bincount(
+                self._entry_antibody[entries],
+                weights=self._entry_log_bind_retain[entries],
+                minlength=len(self._antibodies),
             )
-            [["weight", "weighted_antibody_bind_retain"]]
-            .sum(axis=0)
         )
-        return retained["weighted_antibody_bind_retain"] / retained["weight"]
+
+    def _cached(self, func, mutated_sites):
+        """Get result of `func(mutated_sites)` from the cache, computing if needed.
+
+        The cache is guarded by a lock so the calculator can be called from several
+        threads, but the result is computed without holding the lock.
+
+        """
+        if not self.cache_size:
+            return func(mutated_sites)
+        key = (func.__name__, frozenset(mutated_sites), self.mut_escape_strength)
+        with self._cache_lock:
+            if key in self._cache:
+                self._cache_hits += 1
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            self._cache_misses += 1
+        result = func(mutated_sites)
+        with self._cache_lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def cache_info(self):
+        """Statistics on the cache of results for sets of mutated sites.
+
+        Returns
+        -------
+        CacheInfo
+            Named tuple with cache hits, misses, maximum size, and current size.
+
+        Example
+        -------
+        >>> calc = EscapeCalculator(cache_size=100)
+        >>> float(calc.binding_retained([440, 505]).round(3))
+        0.408
+        >>> float(calc.binding_retained([505, 440]).round(3))
+        0.408
+        >>> calc.cache_info()
+        CacheInfo(hits=1, misses=1, maxsize=100, currsize=1)
+        >>> calc.cache_clear()
+        >>> calc.cache_info()
+        CacheInfo(hits=0, misses=0, maxsize=100, currsize=0)
+
+        """
+        return CacheInfo(
+            self._cache_hits, self._cache_misses, self.cache_size, len(self._cache)
+        )
+
+    def cache_clear(self):
+        """Clear the cache of results and its statistics."""
+        with self._cache_lock:
+            self._cache.clear()
+            self._cache_hits = self._cache_misses = 0
+
+    @_instrumented
+    def binding_retained_many(self, mutated_sites, *, chunksize=500):
+        """Fraction binding or neutralization retained for many sets of mutated sites.
+
+        Gives the same results as applying :meth:`EscapeCalculator.binding_retained`
+        to each set of mutated sites, but is much faster as all sets are scored in
+        a batched computation over the sparse antibody x site escape matrix.
+
+        Parameters
+        ----------
+        mutated_sites : array-like of array-likes of integers, or 2D array
+            Either a list-like (such as a `pandas.Series`) where each entry is a
+            list of mutated sites, or a 2D indicator array (a `numpy.ndarray` or a
+            `scipy.sparse` matrix) with a row for each set of mutated sites and a
+            column for each site in sorted :attr:`EscapeCalculator.sites`, with
+            nonzero entries indicating the site is mutated.
+        chunksize : int
+            Score this many sets of mutated sites at a time to bound memory usage.
+
+        Returns
+        -------
+        numpy.ndarray
+            The fraction binding retained for each set of mutated sites.
+
+        Example
+        -------
+        >>> calc = EscapeCalculator()
+        >>> calc.binding_retained_many([[], [498], [440], [440, 505]]).round(3)
+        array([1.   , 0.817, 0.844, 0.408])
+
+        """
+        inverse, n_unique, chunks = self._unique_log_bind_retain(
+            mutated_sites, chunksize
+        )
+        retained = numpy.empty(n_unique)
+        for chunk_order, log_bind_retain in chunks:
+            # same reduction as `binding_retained` so the results are identical
+            retained[chunk_order] = (
+                numpy.exp(self.mut_escape_strength * log_bind_retain) * self._weights
+            ).sum(axis=1) / self._weights_sum
+        return retained[inverse]
+
+    @_instrumented
+    def binding_retained_sweep(
+        self,
+        mutated_sites,
+        *,
+        mut_escape_strength=None,
+        weight_by_neg_log_ic50=None,
+        reweight=None,
+        chunksize=500,
+    ):
+        """Binding retained for many sets of mutated sites over a grid of parameters.
+
+        Gives the same results as scoring the sets of mutated sites with
+        :meth:`EscapeCalculator.binding_retained_many` using calculators initialized
+        with each combination of the parameters, but is much faster as the binding
+        retained by each antibody only needs to be computed once.
+
+        Parameters
+        ----------
+        mutated_sites : array-like of array-likes of integers, or 2D array
+            Sets of mutated sites as for :meth:`EscapeCalculator.binding_retained_many`.
+        mut_escape_strength : None or array-like of numbers
+            Values of `mut_escape_strength` to use, or `None` to use only the value
+            for this calculator.
+        weight_by_neg_log_ic50 : None or array-like of bool
+            Values of `weight_by_neg_log_ic50` to use, or `None` to use only the
+            value for this calculator.
+        reweight : None or array-like of bool
+            Values of `reweight` to use, or `None` to use only the value for this
+            calculator.
+        chunksize : int
+            Score this many sets of mutated sites at a time to bound memory usage.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Has columns "sequence" (the index of the set of mutated sites),
+            "mut_escape_strength", "weight_by_neg_log_ic50", "reweight", and
+            "binding_retained", with a row for each set of mutated sites and
+            combination of parameters.
+
+        Example
+        -------
+        >>> calc = EscapeCalculator()
+        >>> sweep = calc.binding_retained_sweep(
+        ...     [[], [440, 505]], mut_escape_strength=[1, 2], reweight=[True, False]
+        ... )
+        >>> sweep.columns.tolist()
+        ['sequence', 'mut_escape_strength', 'weight_by_neg_log_ic50', 'reweight', \
+'binding_retained']
+        >>> len(sweep)
+        8
+        >>> calc2 = EscapeCalculator(mut_escape_strength=1, reweight=False)
+        >>> bool(numpy.isclose(
+        ...     sweep.query("sequence == 1 and mut_escape_strength == 1 and not reweight")
+        ...     ["binding_retained"].item(),
+        ...     calc2.binding_retained([440, 505]),
+        ... ))
+        True
+
+        """
+        strengths = numpy.array(
+            [self.mut_escape_strength]
+            if mut_escape_strength is None
+            else mut_escape_strength,
+            dtype=float,
+        )
+        weightings = list(itertools.product(
+            [self.weight_by_neg_log_ic50]
+            if weight_by_neg_log_ic50 is None
+            else weight_by_neg_log_ic50,
+            [self.reweight] if reweight is None else reweight,
+        ))
+        # normalized antibody weights for each combination of weighting parameters
+        weights = numpy.column_stack([
+            numpy.ones(len(self._antibodies))
+            * (self._neg_log_ic50 if by_ic50 else 1)
+            * (self._reweight if by_reweight else 1)
+            for by_ic50, by_reweight in weightings
+        ])
+        weights = weights / weights.sum(axis=0)
+
+        inverse, n_unique, chunks = self._unique_log_bind_retain(
+            mutated_sites, chunksize
+        )
+        retained = numpy.empty((n_unique, len(strengths), len(weightings)))
+        for chunk_order, log_bind_retain in chunks:
+            for i, strength in enumerate(strengths):
+                retained[chunk_order, i] = numpy.exp(strength * log_bind_retain) @ weights
+        retained = retained[inverse]
+
+        n, n_strengths, n_weightings = retained.shape
+        return pd.DataFrame({
+            "sequence": numpy.repeat(numpy.arange(n), n_strengths * n_weightings),
+            "mut_escape_strength": numpy.tile(
+                numpy.repeat(strengths, n_weightings), n
+            ),
+            "weight_by_neg_log_ic50": numpy.tile(
+                [by_ic50 for by_ic50, _ in weightings], n * n_strengths
+            ),
+            "reweight": numpy.tile(
+                [by_reweight for _, by_reweight in weightings], n * n_strengths
+            ),
+            "binding_retained": retained.ravel(),
+        })
+
+    @_instrumented
+    def escape_per_site_many(self, mutated_sites, *, as_array=False, chunksize=500):
+        """Escape at each site for many sets of mutated sites.
+
+        Gives the same results as applying :meth:`EscapeCalculator.escape_per_site`
+        to each set of mutated sites, but is much faster as all sets are scored in
+        a batched computation using matrix products with the weighted antibody x
+        site escape matrix.
+
+        Parameters
+        ----------
+        mutated_sites : array-like of array-likes of integers, or 2D array
+            Sets of mutated sites as for :meth:`EscapeCalculator.binding_retained_many`.
+        as_array : bool
+            Return a 3D array rather than a data frame.
+        chunksize : int
+            Score this many sets of mutated sites at a time to bound memory usage.
+
+        Returns
+        -------
+        pandas.DataFrame or numpy.ndarray
+            If `as_array` is `False`, a data frame with columns "sequence" (the
+            index of the set of mutated sites), "site", "original_escape", and
+            "retained_escape". If `as_array` is `True`, an array with a row for
+            each set of mutated sites, a column for each site in the order of the
+            "site" column of :meth:`EscapeCalculator.escape_per_site`, and the
+            original and retained escape along the last axis.
+
+        Example
+        -------
+        >>> calc = EscapeCalculator()
+        >>> per_site = calc.escape_per_site_many([[], [440, 505]])
+        >>> per_site.query("site == 505").round(3).reset_index(drop=True)
+           sequence  site  original_escape  retained_escape
+        0         0   505            0.957            0.957
+        1         1   505            0.957            0.086
+        >>> per_site_array = calc.escape_per_site_many([[], [440, 505]], as_array=True)
+        >>> per_site_array.shape == (2, len(calc.escape_per_site([])), 2)
+        True
+
+        """
+        sites = self._matrix_sites[self._has_escape]
+        inverse, n_unique, chunks = self._unique_log_bind_retain(
+            mutated_sites, chunksize
+        )
+        retained = numpy.empty((n_unique, len(sites)))
+        for chunk_order, log_bind_retain in chunks:
+            retained[chunk_order] = (
+                numpy.exp(self.mut_escape_strength * log_bind_retain)
+                @ self._weighted_escape
+            )
+        retained = retained[inverse]
+        original = numpy.broadcast_to(
+            self._original_escape[self._has_escape], retained.shape
+        )
+
+        if as_array:
+            return numpy.stack([original, retained], axis=-1)
+        return pd.DataFrame({
+            "sequence": numpy.repeat(numpy.arange(len(retained)), len(sites)),
+            "site": numpy.tile(sites, len(retained)),
+            "original_escape": original.ravel(),
+            "retained_escape": retained.ravel(),
+        })
+
+    def _unique_log_bind_retain(self, mutated_sites, chunksize):
+        """Log binding retained by each antibody for unique sets of mutated sites.
+
+        The log binding retained is for a mutation escape strength of one. Returns
+        a tuple giving the index of the unique set for each set of mutated sites,
+        the number of unique sets, and an iterator over chunks of unique sets giving
+        their indices and a 2D array of log binding retained by each antibody.
+
+        """
+        site_indices = self._site_indices(mutated_sites)
+
+        # identical sets of mutated sites are common, so only score unique ones,
+        # and score them in order of how many sites are mutated to limit padding
+        unique_site_indices, inverse = numpy.unique(
+            site_indices, axis=0, return_inverse=True
+        )
+        n_mutated = (unique_site_indices < len(self._sites_list)).sum(axis=1)
+        order = numpy.argsort(n_mutated, kind="stable")
+
+        def chunks():
+            for start in range(0, len(order), chunksize):
+                chunk_order = order[start: start + chunksize]
+                chunk = unique_site_indices[chunk_order, : n_mutated[chunk_order].max()]
+                entries, pair = self._site_entries(chunk.ravel())
+                log_bind_retain = numpy.bincount(
+                    pair // chunk.shape[1] * len(self._antibodies)
+                    + self._entry_antibody[entries],
+                    weights=self._entry_log_bind_retain[entries],
+                    minlength=len(chunk) * len(self._antibodies),
+                ).reshape(len(chunk), len(self._antibodies))
+                yield chunk_order, log_bind_retain
+
+        return inverse.ravel(), len(unique_site_indices), chunks()
+
+    def _site_indices(self, mutated_sites):
+        """Sorted indices in sorted `self.sites` of each set of mutated sites.
+
+        Returns a 2D integer array with a row for each set of mutated sites, padded
+        at the end of each row with `len(self.sites)`.
+
+        """
+        n_sites = len(self._sites_list)
+        if _is_indicator_array(mutated_sites):
+            if mutated_sites.shape[1] != n_sites:
+                raise ValueError(
+                    f"indicator array has {mutated_sites.shape[1]} columns, but "
+                    f"there are {n_sites} sites"
+                )
+            if hasattr(mutated_sites, "tocsr"):
+                indicator = mutated_sites.tocsr(copy=True)
+                indicator.eliminate_zeros()
+                indicator.sort_indices()
+                counts = numpy.diff(indicator.indptr)
+                rows = numpy.repeat(numpy.arange(indicator.shape[0]), counts)
+                columns = indicator.indices
+            else:
+                rows, columns = numpy.nonzero(mutated_sites)
+                counts = numpy.bincount(rows, minlength=mutated_sites.shape[0])
+        else:
+            indices = []
+            for sites in mutated_sites:
+                try:
+                    indices.append(sorted({self._sites_index[site] for site in sites}))
+                except KeyError:
+                    sites = set(sites)
+                    raise ValueError(f"sites {sites - self.sites} not in {self.sites}")
+            counts = numpy.array([len(i) for i in indices], dtype=int)
+            rows = numpy.repeat(numpy.arange(len(indices)), counts)
+            columns = numpy.fromiter(
+                (i for row_indices in indices for i in row_indices),
+                dtype=int,
+                count=counts.sum(),
+            )
+        site_indices = numpy.full(
+            (len(counts), max(counts, default=0)), n_sites, dtype=int
+        )
+        offsets = numpy.concatenate([[0], numpy.cumsum(counts)[:-1]])
+        site_indices[rows, numpy.arange(len(rows)) - offsets[rows]] = columns
+        return site_indices
+
+    def binding_retained_state(self, mutated_sites=()):
+        """State for incrementally computing binding retained as sites are mutated.
+
+        Parameters
+        ----------
+        mutated_sites : array-like of integers
+            Initially mutated sites.
+
+        Returns
+        -------
+        BindingRetainedState
+
+        """
+        return BindingRetainedState(self, mutated_sites)
+
+    @_instrumented
+    def single_mutant_scan(self, background=()):
+        """Fraction binding retained after mutating each single site.
+
+        Parameters
+        ----------
+        background : array-like of integers
+            Sites already mutated in the background in which each site is mutated.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The binding retained after mutating each site in
+            :attr:`EscapeCalculator.sites` (other than `background`) in addition
+            to the `background` sites.
+
+        Example
+        -------
+        >>> calc = EscapeCalculator()
+        >>> calc.single_mutant_scan().query("site in [440, 498]").round(3)
+             site  binding_retained
+        109   440             0.844
+        167   498             0.817
+
+        """
+        bind_retain, background_bind_retain = self._scan_arrays(background)
+        single = bind_retain @ (self._weights * background_bind_retain) / self._weights_sum
+        return (
+            pd.DataFrame({"site": self._sites_list, "binding_retained": single})
+            .query("site not in @background")
+        )
+
+    @_instrumented
+    def double_mutant_scan(self, background=()):
+        """Fraction binding retained after mutating each pair of sites.
+
+        Parameters
+        ----------
+        background : array-like of integers
+            Sites already mutated in the background in which the pairs are mutated.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The binding retained after mutating each pair of sites `site_1` and
+            `site_2` (with `site_1` < `site_2`) in :attr:`EscapeCalculator.sites`
+            (other than `background`) in addition to the `background` sites.
+
+        Example
+        -------
+        >>> calc = EscapeCalculator()
+        >>> (
+        ...     calc.double_mutant_scan()
+        ...     .query("site_1 == 440 and site_2 == 505")
+        ...     .reset_index(drop=True)
+        ...     .round(3)
+        ... )
+           site_1  site_2  binding_retained
+        0     440     505             0.408
+
+        """
+        bind_retain, background_bind_retain = self._scan_arrays(background)
+        double = (
+            (bind_retain * self._weights * background_bind_retain) @ bind_retain.T
+            / self._weights_sum
+        )
+        i_1, i_2 = numpy.triu_indices(len(self._sites_list), k=1)
+        sites = numpy.array(self._sites_list)
+        return (
+            pd.DataFrame({
+                "site_1": sites[i_1],
+                "site_2": sites[i_2],
+                "binding_retained": double[i_1, i_2],
+            })
+            .query("site_1 not in @background and site_2 not in @background")
+            .reset_index(drop=True)
+        )
+
+    @_instrumented
+    def escape_search(self, n_sites, background=(), *, beam_width=1):
+        """Find sets of sites that most reduce binding retained when mutated.
+
+        Uses a beam search that at each step adds each possible site to each of the
+        `beam_width` best sets found so far, then keeps the `beam_width` best of the
+        resulting sets. With `beam_width` of 1, this is a greedy search.
+
+        Parameters
+        ----------
+        n_sites : int
+            Number of sites to mutate.
+        background : array-like of integers
+            Sites already mutated in the background in which the sites are mutated.
+        beam_width : int
+            Number of best sets of sites kept at each step.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The best sets of `n_sites` sites (as sorted tuples) found by the search,
+            and the binding retained after mutating them in addition to the
+            `background`, sorted from lowest to highest binding retained.
+
+        Example
+        -------
+        >>> calc = EscapeCalculator()
+        >>> best = calc.escape_search(2, beam_width=3)
+        >>> len(best)
+        3
+        >>> bool(best["binding_retained"].is_monotonic_increasing)
+        True
+
+        With no sites to add, the result is the background alone:
+
+        >>> background_only = calc.escape_search(0, background=[440])
+        >>> background_only["sites"].tolist()
+        [()]
+        >>> bool(numpy.isclose(
+        ...     background_only.at[0, "binding_retained"], calc.binding_retained([440])
+        ... ))
+        True
+
+        """
+        bind_retain, background_bind_retain = self._scan_arrays(background)
+        background = set(background)
+        sites = numpy.array(self._sites_list)
+        beam = {
+            (): (
+                background_bind_retain,
+                float((self._weights * background_bind_retain).sum() / self._weights_sum),
+            )
+        }
+        for _ in range(n_sites):
+            candidates = {}
+            worst_candidate = -numpy.inf
+            for beam_sites, (antibody_bind_retain, _) in beam.items():
+                retained = (
+                    bind_retain @ (self._weights * antibody_bind_retain)
+                    / self._weights_sum
+                )
+                for i in numpy.argsort(retained, kind="stable"):
+                    # remaining sites cannot be better than enough existing candidates
+                    if len(candidates) >= beam_width and retained[i] > worst_candidate:
+                        break
+                    site = int(sites[i])
+                    if site in background or site in beam_sites:
+                        continue
+                    new_sites = tuple(sorted((*beam_sites, site)))
+                    if new_sites not in candidates:
+                        candidates[new_sites] = (
+                            antibody_bind_retain * bind_retain[i], retained[i]
+                        )
+                        worst_candidate = max(worst_candidate, retained[i])
+            beam = dict(
+                sorted(candidates.items(), key=lambda item: (item[1][1], item[0]))[
+                    :beam_width
+                ]
+            )
+        return pd.DataFrame(
+            [(beam_sites, retained) for beam_sites, (_, retained) in beam.items()],
+            columns=["sites", "binding_retained"],
+        )
+
+    def _scan_arrays(self, background):
+        """Binding retained at each site and after mutating background for each antibody.
+
+        Returns
+        -------
+        tuple
+            First entry is array with a row for each site in sorted `self.sites`
+            and a column for each antibody, giving the binding retained by that
+            antibody (raised to mutation escape strength) after mutating that site.
+            Second entry is array giving binding retained (raised to mutation escape
+            strength) by each antibody after mutating the `background` sites.
+
+        """
+        background = set(background)
+        if not background.issubset(self.sites):
+            raise ValueError(f"sites {background - self.sites} not in {self.sites}")
+        entries, site_of_entry = self._site_entries(numpy.arange(len(self._sites_list)))
+        log_bind_retain = numpy.zeros((len(self._sites_list), len(self._antibodies)))
+        log_bind_retain[site_of_entry, self._entry_antibody[entries]] = (
+            self._entry_log_bind_retain[entries]
+        )
+        bind_retain = numpy.exp(self.mut_escape_strength * log_bind_retain)
+        return bind_retain, self._antibody_bind_retain(background)
+
+    @_instrumented
+    def score_parallel(
+        self,
+        mutated_sites,
+        *,
+        method="binding_retained",
+        max_workers=None,
+        chunksize=10000,
+    ):
+        """Score many sets of mutated sites in parallel across processes.
+
+        The sets of mutated sites are split into chunks that are scored by a pool of
+        worker processes, and the results are returned in the same order as the
+        input. Each worker gets the calculator once when it starts (on Linux, the
+        workers are forked so they share the calculator's memory until modified).
+
+        Parameters
+        ----------
+        mutated_sites : array-like of array-likes of integers, or 2D array
+            Sets of mutated sites as for :meth:`EscapeCalculator.binding_retained_many`.
+        method : {"binding_retained", "escape_per_site"}
+            Compute :meth:`EscapeCalculator.binding_retained` or
+            :meth:`EscapeCalculator.escape_per_site` for each set of mutated sites.
+        max_workers : None or int
+            Number of worker processes. If `None`, the number of processors.
+            If 1, score in this process.
+        chunksize : int
+            Number of sets of mutated sites sent to a worker at a time.
+
+        Returns
+        -------
+        numpy.ndarray or list
+            If `method` is "binding_retained", array of the fraction binding
+            retained for each set of mutated sites. If `method` is
+            "escape_per_site", list of data frames for each set of mutated sites.
+
+        Example
+        -------
+        >>> calc = EscapeCalculator()
+        >>> calc.score_parallel(
+        ...     [[], [440, 505], [498], [440]], max_workers=2, chunksize=2
+        ... ).round(3)
+        array([1.   , 0.408, 0.817, 0.844])
+
+        """
+        if method not in {"binding_retained", "escape_per_site"}:
+            raise ValueError(f"invalid {method=}")
+        if _is_indicator_array(mutated_sites):
+            n = mutated_sites.shape[0]
+        else:
+            mutated_sites = list(mutated_sites)
+            n = len(mutated_sites)
+        chunks = [
+            mutated_sites[start: start + chunksize] for start in range(0, n, chunksize)
+        ]
+
+        if max_workers == 1:
+            results = [_score_chunk(method, chunk, self) for chunk in chunks]
+        else:
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=_init_score_worker,
+                initargs=(self,),
+            ) as executor:
+                results = list(executor.map(_score_chunk, [method] * len(chunks), chunks))
+
+        if method == "binding_retained":
+            return numpy.concatenate([numpy.zeros(0), *results])
+        else:
+            return [df for result in results for df in result]
+
+
+class BindingRetainedState:
+    """Binding retained that is updated incrementally as sites are mutated or reverted.
+
+    Useful when scoring many closely related sets of mutated sites, such as the
+    nodes of a phylogenetic tree or the steps of mutational paths. Holds the
+    binding retained by each antibody, so mutating or reverting a site only
+    requires updating the antibodies with escape at that site. The binding
+    retained by each antibody is recomputed from its summed log binding retained
+    (which is reset when no mutated sites affect it), and the total is summed
+    over the antibodies rather than accumulated, so rounding errors do not build
+    up as sites are mutated and reverted. Usually created with
+    :meth:`EscapeCalculator.binding_retained_state`.
+
+    Parameters
+    ----------
+    calculator : EscapeCalculator
+        Calculator used to compute binding retained.
+    mutated_sites : array-like of integers
+        Initially mutated sites.
+
+    Example
+    -------
+    >>> calc = EscapeCalculator()
+    >>> state = calc.binding_retained_state([440])
+    >>> state.add_site(505)
+    >>> sorted(state.mutated_sites)
+    [440, 505]
+    >>> float(round(state.binding_retained(), 3))
+    0.408
+    >>> state.remove_site(505)
+    >>> float(round(state.binding_retained(), 3))
+    0.844
+    >>> state.remove_site(440)
+    >>> state.binding_retained()
+    1.0
+
+    """
+    def __init__(self, calculator, mutated_sites=()):
+        """See main class docstring."""
+        self.calculator = calculator
+        n_antibodies = len(calculator._antibodies)
+        self._mutated_sites = set()
+        self._log_bind_retain = numpy.zeros(n_antibodies)
+        self._n_full_escape = numpy.zeros(n_antibodies, dtype=int)
+        self._n_sites = numpy.zeros(n_antibodies, dtype=int)
+        self._antibody_bind_retain = numpy.ones(n_antibodies)
+        self._binding_retained = None
+        for site in mutated_sites:
+            self.add_site(site)
+
+    @property
+    def mutated_sites(self):
+        """frozenset: The currently mutated sites."""
+        return frozenset(self._mutated_sites)
+
+    def binding_retained(self):
+        """Fraction binding or neutralization retained for the current mutated sites.
+
+        Returns
+        -------
+        float
+
+        """
+        if self._binding_retained is None:
+            # same reduction as `EscapeCalculator.binding_retained`
+            self._binding_retained = float(
+                (self._antibody_bind_retain * self.calculator._weights).sum()
+                / self.calculator._weights_sum
+            )
+        return self._binding_retained
+
+    def add_site(self, site):
+        """Mutate a site, doing nothing if it is already mutated.
+
+        Parameters
+        ----------
+        site : int
+            Site in :attr:`EscapeCalculator.sites`.
+
+        """
+        if site not in self._mutated_sites:
+            self._update(site, 1)
+            self._mutated_sites.add(site)
+
+    def remove_site(self, site):
+        """Revert a mutated site, doing nothing if it is not mutated.
+
+        Parameters
+        ----------
+        site : int
+            Site in :attr:`EscapeCalculator.sites`.
+
+        """
+        if site in self._mutated_sites:
+            self._update(site, -1)
+            self._mutated_sites.remove(site)
+
+    def _update(self, site, sign):
+        """Update binding retained for antibodies with escape at mutated or reverted site."""
+        try:
+            i = self.calculator._sites_index[site]
+        except KeyError:
+            raise ValueError(f"site {site} not in {self.calculator.sites}")
+        entries, _ = self.calculator._site_entries(numpy.array([i]))
+        antibodies = self.calculator._entry_antibody[entries]
+        full_escape = self.calculator._entry_full_escape[entries]
+        self._log_bind_retain[antibodies] += sign * numpy.where(
+            full_escape, 0, self.calculator._entry_log_bind_retain[entries]
+        )
+        self._n_full_escape[antibodies] += sign * full_escape
+        self._n_sites[antibodies] += sign
+        self._log_bind_retain[antibodies[self._n_sites[antibodies] == 0]] = 0
+        strength = self.calculator.mut_escape_strength
+        antibody_bind_retain = numpy.where(
+            self._n_full_escape[antibodies] > 0,
+            0.0 ** strength,
+            numpy.exp(strength * self._log_bind_retain[antibodies]),
+        )
+        self._antibody_bind_retain[antibodies] = antibody_bind_retain
+        self._binding_retained = None
+
+    def copy(self):
+        """Copy of the state that can be updated independently.
+
+        Returns
+        -------
+        BindingRetainedState
+
+        """
+        state = BindingRetainedState.__new__(BindingRetainedState)
+        state.calculator = self.calculator
+        state._mutated_sites = set(self._mutated_sites)
+        state._log_bind_retain = self._log_bind_retain.copy()
+        state._n_full_escape = self._n_full_escape.copy()
+        state._n_sites = self._n_sites.copy()
+        state._antibody_bind_retain = self._antibody_bind_retain.copy()
+        state._binding_retained = self._binding_retained
+        return state
+
+
+def _is_indicator_array(mutated_sites):
+    """Are mutated sites specified as a 2D dense or sparse indicator array?"""
+    return hasattr(mutated_sites, "tocsr") or (
+        isinstance(mutated_sites, numpy.ndarray) and mutated_sites.ndim == 2
+    )
+
+
+_score_worker_calculator = None
+"""Calculator used by worker processes of :meth:`EscapeCalculator.score_parallel`."""
+
+
+def _init_score_worker(calculator):
+    """Initialize worker process for :meth:`EscapeCalculator.score_parallel`."""
+    global _score_worker_calculator
+    _score_worker_calculator = calculator
+
+
+def _score_chunk(method, mutated_sites, calculator=None):
+    """Score a chunk of mutated sites for :meth:`EscapeCalculator.score_parallel`."""
+    if calculator is None:
+        calculator = _score_worker_calculator
+    if method == "binding_retained":
+        return calculator.binding_retained_many(mutated_sites)
+    else:
+        per_site = calculator.escape_per_site_many(mutated_sites, as_array=True)
+        sites = calculator.escape_per_site([])["site"].to_numpy()
+        return [
+            pd.DataFrame({
+                "site": sites,
+                "original_escape": escape[:, 0],
+                "retained_escape": escape[:, 1],
+            })
+            for escape in per_site
+        ]
+
+
+def encode_sequences(seqs):
+    """Encode aligned sequences as a 2D array of ASCII codes.
+
+    Parameters
+    ----------
+    seqs : list of str
+        The sequences, which must all be the same length.
+
+    Returns
+    -------
+    numpy.ndarray
+        A read-only array of type `numpy.uint8` with a row for each sequence and a
+        column for each alignment position, giving the code of the upper-case
+        character.
+
+    Example
+    -------
+    >>> encode_sequences(["ACD", "akd"])
+    array([[65, 67, 68],
+           [65, 75, 68]], dtype=uint8)
+
+    """
+    seqs = list(seqs)
+    lengths = {len(seq) for seq in seqs}
+    if len(lengths) > 1:
+        raise ValueError("sequences are not all the same length")
+    return numpy.frombuffer(
+        "".join(seqs).upper().encode("ascii"), dtype=numpy.uint8
+    ).reshape(len(seqs), lengths.pop() if lengths else 0)
+
+
+def mutated_sites_indicator(seqs, reference, sites, *, first_site, ignore_chars="X"):
+    """Indicator array of which sites are mutated in sequences aligned to a reference.
+
+    The sequences are compared to the reference as encoded arrays, so this is much
+    faster than comparing each sequence to the reference in Python.
+
+    Parameters
+    ----------
+    seqs : list of str or numpy.ndarray
+        The aligned sequences, or them encoded by :func:`encode_sequences`.
+    reference : str
+        The aligned reference sequence.
+    sites : array-like of integers
+        Sites for which to get whether they are mutated, such as
+        :attr:`EscapeCalculator.sites`.
+    first_site : int
+        Site number of the first position in the alignment.
+    ignore_chars : str
+        Characters in the sequences (such as ambiguous residues) that are not
+        considered mutations.
+
+    Returns
+    -------
+    numpy.ndarray
+        A boolean array with a row for each sequence and a column for each site
+        in sorted `sites`, which can be passed to
+        :meth:`EscapeCalculator.binding_retained_many`.
+
+    Example
+    -------
+    >>> mutated_sites_indicator(["ACDE", "AKDX", "GCDE"], "ACDE", [2, 3, 4], first_site=1)
+    array([[False, False, False],
+           [ True, False, False],
+           [False, False, False]])
+
+    """
+    if not isinstance(seqs, numpy.ndarray):
+        seqs = encode_sequences(seqs)
+    reference = encode_sequences([reference])[0]
+    if seqs.shape[1] != len(reference):
+        raise ValueError("sequences are not the same length as the reference")
+    positions = numpy.array(sorted(sites), dtype=int) - first_site
+    if len(positions) and (positions.min() < 0 or positions.max() >= len(reference)):
+        raise ValueError("alignment does not cover all sites")
+    aligned = seqs[:, positions]
+    ignore = numpy.frombuffer(ignore_chars.upper().encode("ascii"), dtype=numpy.uint8)
+    return (aligned != reference[positions]) & ~numpy.isin(aligned, ignore)
+
+
+def score_file(
+    calculator,
+    input_file,
+    output_file,
+    *,
+    input_format=None,
+    sites_column="mutated sites",
+    reference=None,
+    first_site=None,
+    ignore_chars="X",
+    per_site_output_file=None,
+    chunksize=10000,
+):
+    """Score sequences in a file, streaming them in chunks to bound memory usage.
+
+    The input is either a CSV or TSV file with a column listing the mutated sites
+    in each sequence as integers separated by any other characters (such as
+    ``440;505`` or ``[440, 505]``), or a FASTA file of RBD sequences aligned to
+    a reference. The output has all the columns of a CSV or TSV input (or the
+    sequence name and mutated sites for a FASTA input) plus a
+    ``binding_retained`` column.
+
+    Parameters
+    ----------
+    calculator : EscapeCalculator
+        Calculator used to score the sequences.
+    input_file : str
+        Input file, or "-" for standard input. May be gzipped if a path.
+    output_file : str
+        Output file, or "-" for standard output. Written in Parquet format (which
+        requires ``pyarrow``) if the name ends in ``.parquet``, TSV format if it ends
+        in ``.tsv``, and CSV format otherwise.
+    input_format : None or {"csv", "tsv", "fasta"}
+        Format of `input_file`. If `None`, inferred from its extension.
+    sites_column : str
+        Column in a CSV or TSV input listing the mutated sites.
+    reference : None or str
+        For a FASTA input, the aligned reference RBD protein sequence.
+    first_site : None or int
+        For a FASTA input, the site number of the first position in the alignment.
+        If `None`, the first site in :attr:`EscapeCalculator.sites`.
+    ignore_chars : str
+        For a FASTA input, characters in the sequences (such as ambiguous residues)
+        that are not considered mutations.
+    per_site_output_file : None or str
+        If not `None`, also write the output of :meth:`EscapeCalculator.escape_per_site`
+        for each sequence to this file (in the same formats as `output_file`), with a
+        ``sequence`` column giving the 0-based index of the sequence in the input.
+    chunksize : int
+        Number of sequences read and scored at a time.
+
+    """
+    if input_format is None:
+        extension = re.sub(r"\.gz$", "", input_file).rsplit(".", 1)[-1].lower()
+        input_format = {
+            "csv": "csv",
+            "tsv": "tsv",
+            "txt": "tsv",
+            "fa": "fasta",
+            "fasta": "fasta",
+            "faa": "fasta",
+        }.get(extension)
+        if input_format is None:
+            raise ValueError(f"cannot infer format of {input_file=}")
+    if input_format in {"csv", "tsv"}:
+        chunks = _read_sites_table_chunks(
+            sys.stdin if input_file == "-" else input_file,
+            {"csv": ",", "tsv": "\t"}[input_format],
+            sites_column,
+            chunksize,
+        )
+    elif input_format == "fasta":
+        if reference is None:
+            raise ValueError("must specify `reference` for FASTA input")
+        if first_site is None:
+            first_site = min(calculator.sites)
+        chunks = _read_fasta_chunks(
+            input_file, calculator, reference, first_site, ignore_chars, chunksize
+        )
+    else:
+        raise ValueError(f"invalid {input_format=}")
+
+    with _ChunkWriter(output_file) as writer, _ChunkWriter(
+        per_site_output_file
+    ) as per_site_writer:
+        n_scored = 0
+        for df, mutated_sites in chunks:
+            writer.write(
+                df.assign(binding_retained=calculator.binding_retained_many(mutated_sites))
+            )
+            if per_site_output_file is not None:
+                per_site = calculator.escape_per_site_many(mutated_sites)
+                per_site_writer.write(
+                    per_site.assign(sequence=per_site["sequence"] + n_scored)
+                )
+            n_scored += len(df)
+
+
+def _parse_sites(sites_str):
+    """Parse list of sites from a string of integers separated by other characters."""
+    return [int(site) for site in re.findall(r"\d+", sites_str)]
+
+
+def _read_sites_table_chunks(input_file, sep, sites_column, chunksize):
+    """Yield chunks of data frame and its mutated sites from a CSV or TSV file."""
+    with pd.read_csv(
+        input_file,
+        sep=sep,
+        chunksize=chunksize,
+        dtype={sites_column: str},
+        keep_default_na=False,
+    ) as reader:
+        for df in reader:
+            if sites_column not in df.columns:
+                raise ValueError(f"no {sites_column=} in {df.columns=}")
+            yield df, [_parse_sites(sites_str) for sites_str in df[sites_column]]
+
+
+def _read_fasta(input_file):
+    """Yield name and sequence of each entry in a FASTA file."""
+    if input_file == "-":
+        f = sys.stdin
+    elif input_file.endswith(".gz"):
+        import gzip
+        f = gzip.open(input_file, "rt")
+    else:
+        f = open(input_file)
+    try:
+        name, seq = None, []
+        for line in f:
+            line = line.strip()
+            if line.startswith(">"):
+                if name is not None:
+                    yield name, "".join(seq)
+                name, seq = line[1:].strip(), []
+            elif line:
+                if name is None:
+                    raise ValueError(f"{input_file} is not in FASTA format")
+                seq.append(line)
+        if name is not None:
+            yield name, "".join(seq)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def _read_fasta_chunks(
+    input_file, calculator, reference, first_site, ignore_chars, chunksize
+):
+    """Yield chunks of data frame and indicator array of mutated sites from FASTA."""
+    names, seqs = [], []
+    for name, seq in itertools.chain(_read_fasta(input_file), [(None, None)]):
+        if name is not None:
+            names.append(name)
+            seqs.append(seq)
+        if names and (len(names) == chunksize or name is None):
+            indicator = mutated_sites_indicator(
+                seqs,
+                reference,
+                calculator.sites,
+                first_site=first_site,
+                ignore_chars=ignore_chars,
+            )
+            df = pd.DataFrame({
+                "name": names,
+                "mutated sites": [
+                    ";".join(map(str, sites))
+                    for sites in _indicator_to_sites(indicator, calculator.sites)
+                ],
+            })
+            yield df, indicator
+            names, seqs = [], []
+
+
+def _indicator_to_sites(indicator, sites):
+    """Convert an indicator array of mutated sites to a list of arrays of sites."""
+    sites = numpy.array(sorted(sites))
+    rows, columns = numpy.nonzero(indicator)
+    counts = numpy.bincount(rows, minlength=indicator.shape[0])
+    return numpy.split(sites[columns], numpy.cumsum(counts)[:-1])
+
+
+class _ChunkWriter:
+    """Context manager that writes data frames in chunks to a CSV, TSV, or Parquet file.
+
+    Does nothing if the file is `None`.
+
+    """
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self._handle = self._parquet_writer = None
+        self._wrote_header = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+        if self._handle is not None and self._handle is not sys.stdout:
+            self._handle.close()
+
+    def write(self, df):
+        """Append a data frame to the file."""
+        if self.output_file is None:
+            return
+        if self.output_file.endswith(".parquet"):
+            import pyarrow
+            import pyarrow.parquet
+
+            # later chunks are converted to the schema of the first chunk, as
+            # their inferred schema differs if a column is all null or integer
+            if self._parquet_writer is None:
+                table = pyarrow.Table.from_pandas(df, preserve_index=False)
+                self._parquet_writer = pyarrow.parquet.ParquetWriter(
+                    self.output_file, table.schema
+                )
+            else:
+                table = pyarrow.Table.from_pandas(
+                    df, schema=self._parquet_writer.schema, preserve_index=False
+                )
+            self._parquet_writer.write_table(table)
+        else:
+            if self._handle is None:
+                if self.output_file == "-":
+                    self._handle = sys.stdout
+                else:
+                    self._handle = open(self.output_file, "w", newline="")
+            df.to_csv(
+                self._handle,
+                sep="\t" if self.output_file.endswith(".tsv") else ",",
+                header=not self._wrote_header,
+                index=False,
+            )
+            self._wrote_header = True
+
+
+SERVER_CALCULATOR_SETTINGS = (
+    "mut_escape_strength",
+    "weight_by_neg_log_ic50",
+    "study",
+    "virus",
+    "sources",
+    "reweight",
+)
+"""Settings of :class:`EscapeCalculator` that can be specified in server requests."""
+
+
+class CalculatorPool:
+    """Calculators kept ready to use for different settings.
+
+    Calculators are created from the same :class:`EscapeData` when their settings are
+    first used, and the least recently used are dropped if there are too many. Each
+    calculator has a batcher for each scoring method, which combines sets of mutated
+    sites submitted concurrently from different threads into a single vectorized
+    call to :meth:`EscapeCalculator.binding_retained_many` or
+    :meth:`EscapeCalculator.escape_per_site_many`.
+
+    Parameters
+    ----------
+    escape_data : EscapeData
+        Data used to create the calculators.
+    max_calculators : int
+        Maximum number of calculators to keep.
+    max_batch_size : int
+        Maximum number of sets of mutated sites to score in a single call.
+
+    Example
+    -------
+    >>> pool = CalculatorPool(EscapeData())
+    >>> pool.binding_retained([[440, 505]], {"virus": "BA.2"}).round(3)
+    array([0.59])
+
+    """
+
+    def __init__(self, escape_data, *, max_calculators=16, max_batch_size=10000):
+        """See main class docstring."""
+        self.escape_data = escape_data
+        self.max_calculators = max_calculators
+        self.max_batch_size = max_batch_size
+        self._calculators = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def calculator(self, settings):
+        """Get the calculator and its batchers for some settings.
+
+        Parameters
+        ----------
+        settings : dict
+            Keyword arguments for :class:`EscapeCalculator` from
+            :data:`SERVER_CALCULATOR_SETTINGS`.
+
+        Returns
+        -------
+        tuple
+            The calculator, and a dict mapping scoring methods to their batchers.
+
+        """
+        invalid = set(settings) - set(SERVER_CALCULATOR_SETTINGS)
+        if invalid:
+            raise ValueError(f"invalid calculator settings {invalid}")
+        key = json.dumps(settings, sort_keys=True)
+        with self._lock:
+            if key in self._calculators:
+                self._calculators.move_to_end(key)
+                return self._calculators[key]
+        # create calculator without holding the lock so other requests can be served
+        try:
+            calculator = self.escape_data.calculator(**settings)
+        except AssertionError as e:
+            raise ValueError(f"invalid calculator {settings=}") from e
+        with self._lock:
+            # only start batchers for the calculator that is kept if another
+            # thread created one for the same settings in the meantime
+            if key not in self._calculators:
+                batchers = {
+                    "binding_retained": _MicroBatcher(
+                        calculator.binding_retained_many, self.max_batch_size
+                    ),
+                    "escape_per_site": _MicroBatcher(
+                        functools.partial(
+                            calculator.escape_per_site_many, as_array=True
+                        ),
+                        self.max_batch_size,
+                    ),
+                }
+                self._calculators[key] = (calculator, batchers)
+                if len(self._calculators) > self.max_calculators:
+                    _, (_, dropped) = self._calculators.popitem(last=False)
+                    for batcher in dropped.values():
+                        batcher.close()
+            return self._calculators[key]
+
+    def _score(self, method, mutated_sites, settings):
+        """Score sets of mutated sites with a batcher."""
+        calculator, batchers = self.calculator(settings)
+        mutated_sites = [list(sites) for sites in mutated_sites]
+        for sites in mutated_sites:
+            if not calculator.sites.issuperset(sites):
+                raise ValueError(
+                    f"sites {set(sites) - calculator.sites} not in {calculator.sites}"
+                )
+        return calculator, batchers[method].submit(mutated_sites)
+
+    def binding_retained(self, mutated_sites, settings=None):
+        """Fraction binding or neutralization retained for sets of mutated sites.
+
+        Parameters
+        ----------
+        mutated_sites : list of lists of integers
+            Sets of mutated sites.
+        settings : None or dict
+            Settings of the calculator as for :meth:`CalculatorPool.calculator`.
+
+        Returns
+        -------
+        numpy.ndarray
+            The fraction binding retained for each set of mutated sites.
+
+        """
+        return self._score("binding_retained", mutated_sites, settings or {})[1]
+
+    def escape_per_site(self, mutated_sites, settings=None):
+        """Escape at each site for sets of mutated sites.
+
+        Parameters
+        ----------
+        mutated_sites : list of lists of integers
+            Sets of mutated sites.
+        settings : None or dict
+            Settings of the calculator as for :meth:`CalculatorPool.calculator`.
+
+        Returns
+        -------
+        tuple
+            The sites, and an array of the original and retained escape at each site
+            for each set of mutated sites as for
+            :meth:`EscapeCalculator.escape_per_site_many` with `as_array=True`.
+
+        """
+        calculator, escape = self._score(
+            "escape_per_site", mutated_sites, settings or {}
+        )
+        return calculator.escape_per_site([])["site"].to_numpy(), escape
+
+
+class _MicroBatcher:
+    """Combines concurrently submitted sets of mutated sites into single calls.
+
+    A background thread takes all submissions waiting in a queue (up to
+    `max_batch_size` sets of mutated sites), scores them with one call to `func`,
+    and returns each submission its slice of the results. While a batch is being
+    scored, new submissions accumulate for the next batch. Sets submitted after the
+    batcher is closed (such as by a request that got the batcher just before its
+    calculator was dropped) are scored directly in the submitting thread.
+
+    """
+
+    def __init__(self, func, max_batch_size):
+        self._func = func
+        self._max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, mutated_sites):
+        """Score sets of mutated sites, waiting for the result."""
+        future = concurrent.futures.Future()
+        with self._lock:
+            queued = not self._closed
+            if queued:
+                self._queue.put((mutated_sites, future))
+        if not queued:
+            return self._func(mutated_sites)
+        return future.result()
+
+    def close(self):
+        """Stop the background thread once submitted sets are scored."""
+        with self._lock:
+            self._closed = True
+            self._queue.put(None)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            n = len(item[0])
+            while n < self._max_batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+                n += len(item[0])
+            try:
+                results = self._func(
+                    [sites for mutated_sites, _ in batch for sites in mutated_sites]
+                )
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            start = 0
+            for sites, future in batch:
+                future.set_result(results[start: start + len(sites)])
+                start += len(sites)
+
+
+class _ScoringServer(http.server.ThreadingHTTPServer):
+    """Server created by :func:`make_server`."""
+
+    # the default backlog of 5 connections resets connections under concurrent load
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class _ScoringRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Handles requests to the server created by :func:`make_server`."""
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path not in {"/binding_retained", "/escape_per_site"}:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+            return
+        try:
+            request = json.loads(
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            )
+            if not isinstance(request, dict):
+                raise TypeError("request is not a JSON object")
+            mutated_sites = request.pop("mutated_sites")
+            pool = self.server.calculator_pool
+            if self.path == "/binding_retained":
+                response = {
+                    "binding_retained": pool.binding_retained(
+                        mutated_sites, request
+                    ).tolist()
+                }
+            else:
+                sites, escape = pool.escape_per_site(mutated_sites, request)
+                response = {
+                    "site": sites.tolist(),
+                    "original_escape": escape[:, :, 0].tolist(),
+                    "retained_escape": escape[:, :, 1].tolist(),
+                }
+        except (KeyError, TypeError, ValueError) as e:
+            self._send_json(400, {"error": f"{type(e).__name__}: {e}"})
+        else:
+            self._send_json(200, response)
+
+    def _send_json(self, status, content):
+        body = json.dumps(content).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(
+    escape_data=None,
+    *,
+    host="127.0.0.1",
+    port=8000,
+    max_calculators=16,
+    max_batch_size=10000,
+    verbose=False,
+):
+    """Create an HTTP server that scores sets of mutated sites.
+
+    The server handles each request in a thread, and keeps calculators for
+    recently used settings in a :class:`CalculatorPool`, which combines concurrent
+    requests into batches. Requests are JSON objects with a "mutated_sites" key
+    giving a list of lists of mutated sites, and optionally any of
+    :data:`SERVER_CALCULATOR_SETTINGS`. The endpoints are:
+
+    - `POST /binding_retained`: responds with "binding_retained" giving the
+      fraction binding retained for each set of mutated sites.
+    - `POST /escape_per_site`: responds with "site" giving the sites, and
+      "original_escape" and "retained_escape" giving the escape at each site for
+      each set of mutated sites.
+    - `GET /health`: responds with "status" of "ok".
+
+    Invalid requests get a response with status 400 and an "error".
+
+    Parameters
+    ----------
+    escape_data : None or EscapeData
+        Data used to create calculators. If `None`, use the default data.
+    host : str
+        Host on which to serve.
+    port : int
+        Port on which to serve. If 0, use any free port.
+    max_calculators : int
+        Maximum number of calculators to keep.
+    max_batch_size : int
+        Maximum number of sets of mutated sites to score in a single call.
+    verbose : bool
+        Log each request to standard error.
+
+    Returns
+    -------
+    http.server.ThreadingHTTPServer
+        Call its `serve_forever` method to serve.
+
+    Example
+    -------
+    >>> server = make_server(port=0)
+    >>> threading.Thread(target=server.serve_forever, daemon=True).start()
+    >>> url = f"http://{server.server_address[0]}:{server.server_address[1]}"
+    >>> response = requests.post(
+    ...     f"{url}/binding_retained",
+    ...     json={"mutated_sites": [[], [440, 505]], "virus": "BA.2"},
+    ... )
+    >>> [round(x, 3) for x in response.json()["binding_retained"]]
+    [1.0, 0.59]
+    >>> server.shutdown()
+    >>> server.server_close()
+
+    """
+    if escape_data is None:
+        escape_data = EscapeData()
+    server = _ScoringServer((host, port), _ScoringRequestHandler)
+    server.calculator_pool = CalculatorPool(
+        escape_data, max_calculators=max_calculators, max_batch_size=max_batch_size
+    )
+    server.verbose = verbose
+    return server
 
 
 if __name__ == '__main__':
-    import doctest
-    doctest.testmod()
+    parser = argparse.ArgumentParser(
+        description="Calculate escape after some mutations to the SARS-CoV-2 RBD. "
+        "With no command, run the doctests.",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    download_parser = subparsers.add_parser(
+        "download",
+        help="Download the default data into a cache for offline use.",
+    )
+    download_parser.add_argument(
+        "--cache_dir",
+        default=DEFAULT_CACHE_DIR,
+        help="Directory in which to cache data.",
+    )
+
+    score_parser = subparsers.add_parser(
+        "score",
+        help="Score sequences in a CSV, TSV, or FASTA file.",
+        description="Score sequences in a CSV or TSV file with a column listing "
+        "mutated sites, or a FASTA file of RBD sequences aligned to a reference. "
+        "Sequences are read, scored, and written in chunks.",
+    )
+    score_parser.add_argument(
+        "input",
+        help='Input CSV, TSV, or FASTA file, or "-" for standard input.',
+    )
+    score_parser.add_argument(
+        "--output",
+        default="-",
+        help='Output CSV, TSV, or Parquet file, or "-" for standard output.',
+    )
+    score_parser.add_argument(
+        "--input_format",
+        choices=["csv", "tsv", "fasta"],
+        help="Format of input, inferred from extension if not specified.",
+    )
+    score_parser.add_argument(
+        "--sites_column",
+        default="mutated sites",
+        help="Column in CSV or TSV input listing mutated sites.",
+    )
+    score_parser.add_argument(
+        "--reference",
+        help="FASTA file with aligned reference RBD for FASTA input.",
+    )
+    score_parser.add_argument(
+        "--first_site",
+        type=int,
+        help="Site number of first alignment position for FASTA input.",
+    )
+    score_parser.add_argument(
+        "--ignore_chars",
+        default="X",
+        help="Characters in FASTA input that are not considered mutations.",
+    )
+    score_parser.add_argument(
+        "--per_site_output",
+        help="Also write escape at each site for each sequence to this file.",
+    )
+    score_parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=10000,
+        help="Number of sequences read and scored at a time.",
+    )
+    score_parser.add_argument(
+        "--snapshot",
+        help="Create calculator from this snapshot file, ignoring other options "
+        "for the calculator.",
+    )
+    score_parser.add_argument(
+        "--cache_dir",
+        help="Directory in which to cache downloaded data.",
+    )
+    score_parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Only use data already in the cache.",
+    )
+    score_parser.add_argument(
+        "--validation",
+        choices=["full", "checksum", "none"],
+        default="full",
+        help="Validation of data: 'checksum' skips checks of data already validated.",
+    )
+    score_parser.add_argument("--virus", help="Compute escape relative to this virus.")
+    score_parser.add_argument("--study", help="Only use antibodies from this study.")
+    score_parser.add_argument(
+        "--mut_escape_strength",
+        type=float,
+        help="Mutation escape strength.",
+    )
+
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="Serve escape calculations over HTTP (see `make_server`).",
+    )
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Host to serve on.")
+    serve_parser.add_argument("--port", type=int, default=8000, help="Port to serve on.")
+    serve_parser.add_argument(
+        "--max_calculators",
+        type=int,
+        default=16,
+        help="Maximum number of calculators for different settings to keep.",
+    )
+    serve_parser.add_argument(
+        "--max_batch_size",
+        type=int,
+        default=10000,
+        help="Maximum number of sets of mutated sites to score in a single call.",
+    )
+    serve_parser.add_argument(
+        "--cache_dir",
+        help="Directory in which to cache downloaded data.",
+    )
+    serve_parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Only use data already in the cache.",
+    )
+    serve_parser.add_argument(
+        "--validation",
+        choices=["full", "checksum", "none"],
+        default="full",
+        help="Validation of data: 'checksum' skips checks of data already validated.",
+    )
+    serve_parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Log each request.",
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "download":
+        download_data(args.cache_dir)
+    elif args.command == "serve":
+        server = make_server(
+            EscapeData(
+                cache_dir=args.cache_dir,
+                offline=args.offline,
+                validation=args.validation,
+            ),
+            host=args.host,
+            port=args.port,
+            max_calculators=args.max_calculators,
+            max_batch_size=args.max_batch_size,
+            verbose=args.verbose,
+        )
+        server.serve_forever()
+    elif args.command == "score":
+        if args.snapshot:
+            calculator = EscapeCalculator.from_snapshot(args.snapshot)
+        else:
+            calculator = EscapeCalculator(
+                cache_dir=args.cache_dir,
+                offline=args.offline,
+                validation=args.validation,
+                virus=args.virus,
+                study=args.study,
+                mut_escape_strength=args.mut_escape_strength,
+            )
+        if args.reference:
+            reference = [seq for _, seq in _read_fasta(args.reference)]
+            if len(reference) != 1:
+                raise ValueError(f"{args.reference} does not have exactly one sequence")
+            reference = reference[0]
+        else:
+            reference = None
+        score_file(
+            calculator,
+            args.input,
+            args.output,
+            input_format=args.input_format,
+            sites_column=args.sites_column,
+            reference=reference,
+            first_site=args.first_site,
+            ignore_chars=args.ignore_chars,
+            per_site_output_file=args.per_site_output,
+            chunksize=args.chunksize,
+        )
+    else:
+        import doctest
+        doctest.testmod()
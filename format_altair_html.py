@@ -6,6 +6,9 @@ You can either use function in module or run as command-line tool.
 
 
 import argparse
+import gzip
+import html
+import re
 import textwrap
 
 from bs4 import BeautifulSoup as bs
@@ -13,8 +16,94 @@ from bs4 import BeautifulSoup as bs
 import markdown
 
 
+BOOTSTRAP_STYLESHEET = {
+    "rel": "stylesheet",
+    "href": "https://cdn.jsdelivr.net/npm/bootstrap@4.3.1/dist/css/bootstrap.min.css",  # noqa: E501
+    "integrity": "sha384-ggOyR0iXCbMQv3Xipma34MD+dH/1fQ784/j6cY/iJTQUOhcWr7x9JvoRxT2MZw1T",  # noqa: E501
+    "crossorigin": "anonymous",
+}
+"""Attributes of link to bootstrap stylesheet for default styling."""
+
+CUSTOM_STYLES = [
+    # custom styling and margins and overflow
+    "#vis {margin-left: 2.5%; margin-left: 2.5%; width: 95vw; overflow-x: auto;}",
+    "#markdown {margin-left: 2.5%; margin-right: 2.5%; margin-top: 10px; }",
+    # fix the margins and font size for selectors within the vega vis
+    "#vis input, #vis label, #vis span {font-size: 14px; margin: 0px 3px 1px 0px;}",
+]
+"""Style rules added to the style in the head of the page."""
+
+# enable math to be added: https://stackoverflow.com/a/54373640
+MATHJAX_SCRIPT = textwrap.dedent(
+    r"""
+    <script type="text/javascript"
+        src="https://cdnjs.cloudflare.com/ajax/libs/mathjax/2.7.4/MathJax.js?config=TeX-AMS_HTML-full">
+    </script>
+    <script type="text/x-mathjax-config">
+        MathJax.Hub.Config({
+            tex2jax: {
+                inlineMath: [["$", "$"], ["\\\\(", "\\\\)"]],
+                displayMath: [["$$", "$$"], ["\\[", "\\]"]],
+                processEscapes: true
+            },
+            config: ["MMLorHTML.js"],
+            jax: ["input/TeX", "output/HTML-CSS", "output/NativeMML"],
+            extensions: ["MathMenu.js", "MathZoom.js"]
+        });
+    </script>
+    """
+)
+"""Scripts to enable MathJax, added after the head of the page."""
+
+
+def _find_one(html_str, anchor):
+    """Index of the only occurrence of `anchor` in `html_str`."""
+    if html_str.count(anchor) != 1:
+        raise ValueError(f"failed to find exactly one {anchor}")
+    return html_str.index(anchor)
+
+
+def minify_html(html_str):
+    r"""Remove indentation and blank lines from HTML.
+
+    Runs of whitespace that contain a newline are replaced by a single newline,
+    which browsers render the same way. The contents of ``<pre>``, ``<textarea>``,
+    and ``<script>`` elements are left unchanged.
+
+    Parameters
+    ----------
+    html_str : str
+        HTML to minify.
+
+    Returns
+    -------
+    str
+        The minified HTML.
+
+    Example
+    -------
+    >>> minify_html("<div>\n  <p>a  b</p>\n\n  <pre>\n  x\n</pre>\n</div>\n")
+    '<div>\n<p>a  b</p>\n<pre>\n  x\n</pre>\n</div>\n'
+    """
+    parts = re.split(
+        r"(<(pre|textarea|script)\b.*?</\2\s*>)",
+        html_str,
+        flags=re.DOTALL | re.IGNORECASE,
+    )
+    # `re.split` gives the text between elements, the element, and the tag name
+    return "".join(
+        part if i % 3 == 1 else re.sub(r"\s*\n\s*", "\n", part)
+        for i, part in enumerate(parts)
+        if i % 3 != 2
+    )
+
+
 def annotate_altair_chart(
-    chart_html, annotation_md, twitter_card, google_analytics_tag,
+    chart_html,
+    annotation_md,
+    twitter_card,
+    google_analytics_tag,
+    prettify=True,
 ):
     """
     This function annotates an altair chart with a twitter card and markdown
@@ -31,27 +120,90 @@ def annotate_altair_chart(
         Site name, title, description and optionally image for Twitter card.
     google_analytics_tag : str
         Path to text with Google analytics tag.
+    prettify : bool
+        Parse the whole page and write it formatted to be human readable. If
+        `False`, instead splice the additions into the page at the ends of its
+        head and body, leaving the rest of the page (including the embedded
+        spec and data) as is, which is much faster for large charts and gives a
+        smaller page.
 
     Returns
     -------
     str:
-        A string of the HTML page formatted to be human readable.
+        A string of the HTML page, formatted to be human readable if `prettify`.
     """
 
-    # Get the main page content
+    if not all(key in twitter_card.keys() for key in ["site", "title", "description"]):
+        raise ValueError(
+            "Missing required fields for twitter card: site, title, or description"
+        )
+
     with open(chart_html, "r") as chart_file:
-        page = bs(chart_file, "html.parser")
+        html_str = chart_file.read()
 
     # Get the annotation and convert it from markdown to HTML
     with open(annotation_md, "r") as markdow_file:
-        annotation = bs(
-            markdown.markdown(
-                markdow_file.read(),
-                extensions=["mdx_math"],
+        annotation_html = markdown.markdown(
+            markdow_file.read(),
+            extensions=["mdx_math"],
+        )
+
+    if google_analytics_tag:
+        with open(google_analytics_tag) as f:
+            tag = f.read()
+        if not tag.endswith("\n"):
+            tag = tag + "\n"
+    else:
+        tag = ""
+
+    if not prettify:
+        # Add the custom styling to the end of the style in the head if there is
+        # one, so it comes before the bootstrap stylesheet as when prettifying
+        head_end = _find_one(html_str, "</head>")
+        style_end = html_str.find("</style>", 0, head_end)
+        styles = "\n".join(CUSTOM_STYLES) + "\n"
+        if style_end == -1:
+            head_additions = [f"<style>\n{styles}</style>"]
+        else:
+            html_str = html_str[:style_end] + styles + html_str[style_end:]
+            head_additions = []
+
+        # Make the twitter card and add the default styling with bootstrap
+        head_additions += [
+            '<meta content="summary" name="twitter:card"/>',
+            *(
+                f'<meta content="{html.escape(content)}" name="twitter:{name}"/>'
+                for name, content in twitter_card.items()
             ),
-            "html.parser"
+            "<link "
+            + " ".join(
+                f'{name}="{html.escape(value)}"'
+                for name, value in BOOTSTRAP_STYLESHEET.items()
+            )
+            + "/>",
+        ]
+        head_end = _find_one(html_str, "</head>")
+        html_str = (
+            html_str[:head_end]
+            + "\n".join(head_additions)
+            + "\n</head>\n"
+            + tag
+            + MATHJAX_SCRIPT
+            + html_str[head_end + len("</head>"):].lstrip("\n")
+        )
+
+        # Add the annotation to the bottom of the page
+        body_end = _find_one(html_str, "</body>")
+        return (
+            html_str[:body_end]
+            + f'<div id="markdown">\n<hr/>\n{annotation_html}\n</div>\n'
+            + html_str[body_end:]
         )
 
+    # Get the main page content
+    page = bs(html_str, "html.parser")
+    annotation = bs(annotation_html, "html.parser")
+
     # Add the annotation to the bottom of the page
     markdown_container = page.new_tag("div", attrs={"id": "markdown"})
     page.body.append(markdown_container)
@@ -60,10 +212,6 @@ def annotate_altair_chart(
     markdown_container.append(annotation)
 
     # Make and add the twitter card
-    if not all(key in twitter_card.keys() for key in ["site", "title", "description"]):
-        raise ValueError(
-            "Missing required fields for twitter card: site, title, or description"
-        )
     summary = page.new_tag("meta", attrs={"name": "twitter:card", "content": "summary"})
     page.head.append(summary)
     for name, content in twitter_card.items():
@@ -73,61 +221,21 @@ def annotate_altair_chart(
         page.head.append(card_tag)
 
     # Add some default styling with bootstrap
-    stylesheet = page.new_tag(
-        "link",
-        attrs={
-            "rel": "stylesheet",
-            "href": "https://cdn.jsdelivr.net/npm/bootstrap@4.3.1/dist/css/bootstrap.min.css",  # noqa: E501
-            "integrity": "sha384-ggOyR0iXCbMQv3Xipma34MD+dH/1fQ784/j6cY/iJTQUOhcWr7x9JvoRxT2MZw1T",  # noqa: E501
-            "crossorigin": "anonymous",
-        },
-    )
+    stylesheet = page.new_tag("link", attrs=BOOTSTRAP_STYLESHEET)
     page.head.append(stylesheet)
 
-    # Add some custom styling and margins and overflow
-    page.head.style.append(
-        "#vis {margin-left: 2.5%; margin-left: 2.5%; width: 95vw; overflow-x: auto;}"
-    )
-    page.head.style.append(
-        "#markdown {margin-left: 2.5%; margin-right: 2.5%; margin-top: 10px; }"
-    )
-    # Fix the margins and font size for selectors within the vega vis
-    page.head.style.append(
-        "#vis input, #vis label, #vis span {font-size: 14px; margin: 0px 3px 1px 0px;}"
-    )
+    # Add some custom styling
+    for style in CUSTOM_STYLES:
+        page.head.style.append(style)
 
     html_str = page.prettify()
 
-    # enable math to be added: https://stackoverflow.com/a/54373640
-    mathjax_script = textwrap.dedent(
-        r"""
-        <script type="text/javascript"
-            src="https://cdnjs.cloudflare.com/ajax/libs/mathjax/2.7.4/MathJax.js?config=TeX-AMS_HTML-full">
-        </script>
-        <script type="text/x-mathjax-config">
-            MathJax.Hub.Config({
-                tex2jax: {
-                    inlineMath: [["$", "$"], ["\\\\(", "\\\\)"]],
-                    displayMath: [["$$", "$$"], ["\\[", "\\]"]],
-                    processEscapes: true
-                },
-                config: ["MMLorHTML.js"],
-                jax: ["input/TeX", "output/HTML-CSS", "output/NativeMML"],
-                extensions: ["MathMenu.js", "MathZoom.js"]
-            });
-        </script>
-        """
-    )
     if html_str.count("</head>\n") == 1:
-        html_str = html_str.replace("</head>\n", "</head>\n" + mathjax_script)
+        html_str = html_str.replace("</head>\n", "</head>\n" + MATHJAX_SCRIPT)
     else:
             raise ValueError("failed to find exactly one tag end")
 
-    if google_analytics_tag:
-        with open(google_analytics_tag) as f:
-            tag = f.read()
-        if not tag.endswith("\n"):
-            tag = tag + "\n"
+    if tag:
         if html_str.count("</head>\n") == 1:
             html_str = html_str.replace("</head>\n", "</head>\n" + tag)
         else:
@@ -192,6 +300,24 @@ if __name__ == "__main__":
         help="Path to file containing Google analytics tag.",
     )
 
+    parser.add_argument(
+        "--no_prettify",
+        action="store_true",
+        help="Splice additions into the page rather than parsing and prettifying it.",
+    )
+
+    parser.add_argument(
+        "--minify",
+        action="store_true",
+        help="Remove indentation and blank lines from the formatted chart.",
+    )
+
+    parser.add_argument(
+        "--gzip",
+        action="store_true",
+        help="Also write the formatted chart compressed with gzip to output + '.gz'.",
+    )
+
     parser.add_argument(
         "--output",
         type=str,
@@ -211,8 +337,18 @@ if __name__ == "__main__":
         twitter_dictionary["image"] = args.image
     # Get the formated HTML as a string
     annotated_chart = annotate_altair_chart(
-        args.chart, args.markdown, twitter_dictionary, args.google_analytics_tag,
+        args.chart,
+        args.markdown,
+        twitter_dictionary,
+        args.google_analytics_tag,
+        prettify=not args.no_prettify,
     )
+    if args.minify:
+        annotated_chart = minify_html(annotated_chart)
     # Write out to a file
     with open(args.output, "w") as outfile:
         outfile.write(annotated_chart)
+    if args.gzip:
+        # set the modification time so the compressed file only changes with chart
+        with open(f"{args.output}.gz", "wb") as outfile:
+            outfile.write(gzip.compress(annotated_chart.encode("utf-8"), mtime=0))
@@ -0,0 +1,1048 @@
+"""Process the deep mutational scanning data for the escape calculator.
+
+The data come from the following papers from Yunlong Cao's group:
+
+ - `Imprinted SARS-CoV-2 humoral immunity induces convergent Omicron RBD evolution
+   (2022) <https://www.nature.com/articles/s41586-022-05644-7>`_
+
+ - `Repeated Omicron infection alleviates SARS-CoV-2 immune imprinting (2024)
+   <https://www.nature.com/articles/s41586-023-06753-7>`_
+
+ - `Evolving antibody response to SARS-CoV-2 antigenic shift from XBB to JN.1
+   <https://www.nature.com/articles/s41586-024-08315-x>`_
+
+Processing is split into stages: one for each study, which reads the antibody
+information and escape data for that study, and a final stage that aggregates the
+studies and gives the files written to ``./results/``. The output of each stage is
+cached, keyed on the hashes of its input files, the sections of the configuration
+it uses, and its code, so only stages whose inputs changed are rerun.
+
+You can either use functions in module or run as command-line tool.
+
+"""
+
+
+import argparse
+import concurrent.futures
+import hashlib
+import inspect
+import json
+import os
+
+import numpy
+
+import pandas as pd
+
+import yaml
+
+
+DMS_CHUNKSIZE = 1000000
+"""Number of rows of the per-mutation DMS files read at a time."""
+
+
+def aggregate_site_escape(path, *, chunksize=DMS_CHUNKSIZE):
+    """Sum per-mutation escape at each site for each antibody.
+
+    The file is read in chunks so memory use is bounded by the size of the chunks
+    and the per-site output rather than the size of the file. Rows without a site
+    are dropped.
+
+    Parameters
+    ----------
+    path : str
+        Path to CSV with columns "antibody", "site", and "mut_escape" (other
+        columns are ignored), which may be compressed.
+    chunksize : int
+        Number of rows to read at a time.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Has columns "antibody", "site", and "escape", sorted by antibody and site.
+
+    """
+    partial_sums = []
+    with pd.read_csv(
+        path,
+        usecols=["antibody", "site", "mut_escape"],
+        # nullable integer sites as some files have rows without a site
+        dtype={"antibody": "category", "site": "Int32", "mut_escape": "float64"},
+        chunksize=chunksize,
+    ) as chunks:
+        for chunk in chunks:
+            partial_sums.append(
+                chunk
+                .groupby(["antibody", "site"], observed=True)["mut_escape"]
+                .sum()
+                .reset_index()
+                .astype({"antibody": str})
+            )
+    return (
+        pd.concat(partial_sums, ignore_index=True)
+        .groupby(["antibody", "site"], as_index=False)
+        .aggregate(escape=pd.NamedAgg("mut_escape", "sum"))
+        .astype({"site": int})
+    )
+
+
+def process_evolving_2024(data_dir, config):
+    """Process data from `Evolving antibody response to SARS-CoV-2 antigenic shift
+    from XBB to JN.1 <https://www.nature.com/articles/s41586-024-08315-x>`_.
+
+    Parameters
+    ----------
+    data_dir : str
+        Directory with the data from the papers.
+    config : dict
+        Configuration.
+
+    Returns
+    -------
+    dict
+        Data frames of antibody "source", "ic50s", and "escape".
+
+    """
+    # read the antibody data
+    info = (
+        pd.read_csv(
+            os.path.join(data_dir, "JN1-evolving-antibody-response/data/_Table_S2.csv")
+        )
+        .assign(study="evolving_2024")
+    )
+    assert len(info) == info["antibody"].nunique()
+
+    # get the antibody sources
+    source = info[["antibody", "source", "study"]]
+
+    # get the IC50s
+    viruses = [
+        "D614G",
+        "BA.1",
+        "BA.2",
+        "BA.5",
+        "XBB.1.5",
+        "HK.3.1",
+        "BA.2.86",
+        "JN.1",
+        "JN.1+F456L",
+        "KP.2",
+        "JN.1+F456L+A475V",
+        "KP.3",
+        "KP.3+A475V",
+    ]
+    assert set(viruses).issubset(info.columns)
+    ic50s = (
+        info
+        .melt(
+            id_vars=["study", "antibody"],
+            value_vars=viruses,
+            var_name="virus",
+            value_name="IC50",
+        )
+        .query("IC50 != 'N.D.'")  # IC50 not measured
+        # 10 is max value, taken to mean no neutralization
+        .assign(
+            IC50=lambda x: x["IC50"].map(
+                lambda ic50: 10 if ic50 == ">10" else min(10, float(ic50))
+            )
+        )
+    )
+
+    # read the escape data
+    escape = aggregate_site_escape(
+        os.path.join(
+            data_dir,
+            "JN1-evolving-antibody-response/data/DMS/antibody/"
+            "dms_antibodies_XBB15_JN1_agg.csv",
+        )
+    ).assign(study="evolving_2024")
+
+    # The antibodies are named "BD57-<xxx>" in the antibody info, and
+    # "GC<xxx>" in the escape data; harmonize
+    assert not ic50s["antibody"].str.startswith("GC").any()
+    escape = escape.assign(
+        antibody=lambda x: x["antibody"].map(
+            lambda a: "BD57-" + a[2:] if a.startswith("GC") else a
+        )
+    )
+
+    # only keep escape for antibodies with IC50s
+    antibodies = set(ic50s["antibody"]).intersection(escape["antibody"])
+    escape = escape.query("antibody in @antibodies")
+
+    return {"source": source, "ic50s": ic50s, "escape": escape}
+
+
+def process_repeated_2024(data_dir, config):
+    """Process data from `Repeated Omicron infection alleviates SARS-CoV-2 immune
+    imprinting (2024) <https://www.nature.com/articles/s41586-023-06753-7>`_.
+
+    Also computes the antibody re-weightings described in that paper. We re-weight
+    the cross-reactive antibodies from each source by an amount :math:`w` so that the
+    desired cross-reactive fraction :math:`x` satisfies
+    :math:`x = \\frac{w N_c}{w N_c + N_s}`, where :math:`N_c` is the number of
+    cross-reactive antibodies and :math:`N_s` is the number of specific antibodies.
+    This is achieved by :math:`w = \\frac{x N_s}{N_c (1 - x)}`; we then adjust the
+    weights so the mean weight over all antibodies for the source is one.
+
+    Parameters
+    ----------
+    data_dir : str
+        Directory with the data from the papers.
+    config : dict
+        Configuration, with the desired cross-reactive fraction for sources in
+        `config["antibody_reweighting"]["repeated_2024"]["cross_reactive_weights"]`.
+
+    Returns
+    -------
+    dict
+        Data frames of antibody "source", "ic50s", "escape", and "reweighting",
+        and under "qc" a dict of titled data frames confirming the re-weighting.
+
+    """
+    # read the data
+    info = (
+        pd.read_csv(os.path.join(data_dir, "SARS-CoV-2-reinfection-DMS/antibody_info.csv"))
+        .rename(columns={"Unnamed: 0": "antibody"})
+    ).assign(study="repeated_2024")
+    assert len(info) == info["antibody"].nunique()
+
+    # get the antibody sources
+    source = (
+        info
+        [["antibody", "source", "study"]]
+        .query("source != 'WT mouse'")  # do not keep mouse antibodies
+    )
+
+    # get the IC50s
+    ic50s = (
+        info
+        .melt(
+            id_vars=["study", "antibody"],
+            value_vars=[c for c in info if c.endswith("_IC50")],
+            var_name="virus",
+            value_name="IC50",
+        )
+        .query("IC50.notnull()")  # no data, 10 means non-neutralizing
+        .assign(
+            virus=lambda x: x["virus"].str.replace("_IC50", "").map({
+                "D614G": "D614G",
+                "BA1": "BA.1",
+                "BA2": "BA.2",
+                "BA3": "BA.3",
+                "SARS": "SARS",
+                "BA1_1": "BA.1.1",
+                "BA2_12_1": "BA.2.12.1",
+                "BA2_75": "BA.2.75",
+                "BA5": "BA.5",
+                "BF7": "BF.7",
+                "BA2_13": "BA.2.13",
+                "BQ1_1": "BQ.1.1",
+                "XBB": "XBB",
+                "XBB1_5": "XBB.1.5",
+                "XBB1_5_10": "XBB.1.5.10",
+            }),
+        )
+    )
+
+    # get the binding reactivities
+    binding = (
+        info
+        .query("paper_reactivity != '--'")
+        .assign(
+            binds=lambda x: x["paper_reactivity"].map(
+                {
+                    "WT": ["Wuhan-Hu-1"],
+                    "cross": ["Wuhan-Hu-1", "Omicron BA.2/BA.5"],
+                    "specific": ["Omicron BA.2/BA.5"],
+                }
+            )
+        )
+        [["study", "antibody", "binds"]]
+        .explode("binds")
+    )
+
+    # read the escape data
+    escape = aggregate_site_escape(
+        os.path.join(
+            data_dir, "SARS-CoV-2-reinfection-DMS/antibody_dms_merge_clean.csv.gz"
+        )
+    ).assign(study="repeated_2024")
+
+    # get the antibody re-weightings
+    desired_reweighting = (
+        pd.Series(
+            config["antibody_reweighting"]["repeated_2024"]["cross_reactive_weights"]
+        )
+        .rename_axis("source")
+        .rename("desired_cross_reactive_frac")
+        .reset_index()
+    )
+    assert set(desired_reweighting["source"]).issubset(source["source"])
+    reweighting = (
+        binding
+        .groupby("antibody", as_index=False)
+        .aggregate(n_binds=pd.NamedAgg("binds", "nunique"))
+        .assign(cross_reactive=lambda x: x["n_binds"] == 2)
+        .merge(source, on="antibody", validate="one_to_one")
+        .merge(desired_reweighting, on="source", validate="many_to_one")
+        .assign(
+            N_c=lambda x: x.groupby("source")["cross_reactive"].transform("sum"),
+            N=lambda x: x.groupby("source")["antibody"].transform("count"),
+            N_s=lambda x: x["N"] - x["N_c"],
+            cross_reactive_frac=lambda x: x["N_c"] / x["N"],
+            reweight=lambda x: numpy.where(
+                x["cross_reactive"],
+                (
+                    x["desired_cross_reactive_frac"] * x["N_s"]
+                    / (x["N_c"] * (1 - x["desired_cross_reactive_frac"]))
+                ),
+                1,
+            ),
+        )
+        .assign(
+            reweight=lambda x: (
+                x["reweight"] / x.groupby("source")["reweight"].transform("mean")
+            ),
+        )
+    )
+
+    # confirm the re-weighting gives the desired cross-reactive fractions
+    qc = {
+        "Antibody re-weightings used for repeated_2024": (
+            reweighting
+            .groupby(["source", "cross_reactive"], as_index=False)
+            .aggregate(
+                n_antibodies=pd.NamedAgg("antibody", "count"),
+                reweight=pd.NamedAgg("reweight", "first"),
+            )
+        ),
+        "Cross-reactive fractions after re-weighting repeated_2024": (
+            reweighting
+            .assign(cross_reactive_reweight=lambda x: x["cross_reactive"] * x["reweight"])
+            .groupby(
+                ["source", "desired_cross_reactive_frac", "cross_reactive_frac"],
+                as_index=False,
+            )
+            .aggregate(
+                n_antibodies=pd.NamedAgg("antibody", "nunique"),
+                summed_reweights=pd.NamedAgg("reweight", "sum"),
+                reweighted_cross_reactive_sum=pd.NamedAgg(
+                    "cross_reactive_reweight", "sum"
+                ),
+            )
+            .assign(
+                cross_reactive_reweight_frac=lambda x: (
+                    x["reweighted_cross_reactive_sum"] / x["summed_reweights"]
+                ),
+            )
+            .drop(columns="reweighted_cross_reactive_sum")
+        ),
+    }
+
+    return {
+        "source": source,
+        "ic50s": ic50s,
+        "escape": escape,
+        "reweighting": reweighting[["antibody", "study", "reweight"]],
+        "qc": qc,
+    }
+
+
+def process_imprinted_2022(data_dir, config):
+    """Process data from `Imprinted SARS-CoV-2 humoral immunity induces convergent
+    Omicron RBD evolution (2022) <https://www.nature.com/articles/s41586-022-05644-7>`_.
+
+    Parameters
+    ----------
+    data_dir : str
+        Directory with the data from the papers.
+    config : dict
+        Configuration.
+
+    Returns
+    -------
+    dict
+        Data frames of antibody "source", "ic50s", and "escape".
+
+    """
+    # read the data, which is in multiple sheets
+    raw_info = pd.read_excel(
+        os.path.join(data_dir, "convergent_RBD_evolution/antibody_info.xlsx"),
+        header=1,
+        sheet_name=None,
+        usecols=lambda c: not c.startswith("Unnamed"),
+    )
+
+    common_cols = None
+    for sheet in raw_info.values():
+        columns = sheet.columns.tolist()
+        if common_cols is None:
+            common_cols = columns
+        else:
+            common_cols = [
+                c for c in columns if c in set(common_cols).intersection(columns)
+            ]
+
+    info = pd.concat(
+        [
+            sheet[common_cols].assign(sheet_name=sheet_name)
+            for sheet_name, sheet in raw_info.items()
+        ],
+        ignore_index=True,
+    ).rename(columns={"Antibody  Name": "antibody"}).assign(study="imprinted_2022")
+    assert len(info) == info["antibody"].nunique()
+
+    # get the antibody sources
+    source = (
+        info
+        [["antibody", "source", "study"]]
+        .query("source != 'WT-engineered'")
+    )
+
+    # get the IC50s
+    ic50s = (
+        info
+        .melt(
+            id_vars=["study", "antibody"],
+            value_vars=["D614G", "BA.1", "BA.2", "BA.5", "BA.2.75", "BQ.1.1", "XBB"],
+            var_name="virus",
+            value_name="IC50",
+        )
+        # values of >10 to 10
+        .query("IC50 != '--'")
+        .assign(
+            IC50=lambda x: x["IC50"].map(lambda ic50: 10 if ic50 == ">10" else float(ic50))
+        )
+    )
+
+    # read the escape data
+    escape = aggregate_site_escape(
+        os.path.join(data_dir, "convergent_RBD_evolution/use_res_clean.csv")
+    ).assign(study="imprinted_2022")
+
+    return {"source": source, "ic50s": ic50s, "escape": escape}
+
+
+def sig_sites_histogram(n_sig_escape, max_sig_sites, bin_width=5):
+    """Histogram of number of sites of significant escape per antibody.
+
+    Parameters
+    ----------
+    n_sig_escape : pandas.DataFrame
+        Has columns "antibody", "study", and "n_sites".
+    max_sig_sites : int
+        Antibodies with more than this many sites are dropped. It is always a bin edge.
+    bin_width : int
+        Width of the bins.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Number of antibodies from each study in each bin, and whether the
+        antibodies in that bin are kept.
+
+    Example
+    -------
+    >>> n_sig_escape = pd.DataFrame({
+    ...     "antibody": ["a", "b", "c", "d"],
+    ...     "study": ["x", "x", "y", "y"],
+    ...     "n_sites": [1, 7, 2, 12],
+    ... })
+    >>> sig_sites_histogram(n_sig_escape, max_sig_sites=8)
+      n_sites  x  y   kept
+    0     1-5  1  1   True
+    1     6-8  1  0   True
+    2   11-15  0  1  False
+
+    """
+    edges = sorted(
+        set(range(0, n_sig_escape["n_sites"].max() + bin_width, bin_width))
+        | {max_sig_sites}
+    )
+    histogram = (
+        n_sig_escape
+        .assign(n_sites=lambda x: pd.cut(x["n_sites"], edges))
+        .pivot_table(
+            index="n_sites",
+            columns="study",
+            values="antibody",
+            aggfunc="count",
+            fill_value=0,
+            observed=True,
+        )
+        .rename_axis(columns=None)
+    )
+    return (
+        histogram
+        .assign(kept=[b.right <= max_sig_sites for b in histogram.index])
+        .set_axis([f"{b.left + 1}-{b.right}" for b in histogram.index], axis=0)
+        .rename_axis("n_sites")
+        .reset_index()
+    )
+
+
+def aggregate_studies(data_dir, config, studies):
+    """Aggregate the data from the different studies.
+
+    Antibodies duplicated across studies (according to
+    ``all-repo-duplicates.xlsx``) are only kept once. Escape is normalized so the
+    max site escape for each antibody is one, and antibodies with too many sites
+    of significant escape are dropped. Only antibodies with all types of
+    measurements are kept.
+
+    Parameters
+    ----------
+    data_dir : str
+        Directory with the data from the papers.
+    config : dict
+        Configuration.
+    studies : dict
+        Maps the name of each study to the output of its processing function.
+
+    Returns
+    -------
+    dict
+        Data frames to write to the results files, keyed by their file names,
+        and under "qc" a dict of titled data frames summarizing what was dropped.
+
+    """
+    # get names of duplicated antibodies
+    antibody_renaming = (
+        pd.read_excel(os.path.join(data_dir, "all-repo-duplicates.xlsx"))
+        .set_index("Antibody  Name")
+        ["BD equivalent name"]
+        .to_dict()
+    )
+
+    def rename(antibody):
+        return antibody_renaming[antibody] if antibody in antibody_renaming else antibody
+
+    # aggregate the antibody sources, keeping just one of antibodies repeated
+    # across studies
+    antibody_source = (
+        pd.concat([data["source"] for data in studies.values()], ignore_index=True)
+        .assign(antibody=lambda x: x["antibody"].map(rename))
+    )
+    qc = {
+        "Dropped antibodies duplicated across studies": (
+            antibody_source.groupby("antibody").tail(-1).reset_index(drop=True)
+        ),
+    }
+    antibody_source = antibody_source.groupby("antibody").first().reset_index()
+    assert (
+        antibody_source["antibody"].nunique()
+        == len(antibody_source[["antibody", "source"]].drop_duplicates())
+    )
+
+    # aggregate the IC50s clipping to be between 1e-5 and 10, keeping just one of
+    # the IC50s repeated across studies
+    antibody_ic50s = (
+        pd.concat([data["ic50s"] for data in studies.values()], ignore_index=True)
+        .assign(
+            antibody=lambda x: x["antibody"].map(rename),
+            IC50=lambda x: x["IC50"].clip(lower=1e-5, upper=10)
+        )
+    )
+    qc["Dropped IC50s duplicated across studies"] = (
+        antibody_ic50s.groupby(["antibody", "virus"]).tail(-1).reset_index(drop=True)
+    )
+    antibody_ic50s = antibody_ic50s.groupby(["antibody", "virus"]).first().reset_index()
+
+    # only keep IC50s for viruses w enough antibodies
+    virus_min_antibodies = config["virus_min_antibodies_w_ic50"]
+    n_antibodies_per_virus = (
+        antibody_ic50s
+        .groupby("virus")
+        .aggregate(n_antibodies=pd.NamedAgg("antibody", "nunique"))
+        .reset_index()
+    )
+    viruses_w_enough_antibodies = (
+        n_antibodies_per_virus
+        .query("n_antibodies >= @virus_min_antibodies")
+        ["virus"]
+        .tolist()
+    )
+    antibody_ic50s = antibody_ic50s.query("virus in @viruses_w_enough_antibodies")
+    assert antibody_ic50s["IC50"].dtype == float
+    assert (antibody_ic50s["IC50"] <= 10).all()
+
+    # combine the escape data, keeping only the escape data in the antibody source
+    # data frame for that study, and normalizing the max site escape for each
+    # antibody to 1
+    escape = (
+        pd.concat(
+            [
+                (
+                    data["escape"]
+                    .assign(antibody=lambda x: x["antibody"].map(rename))
+                    .merge(antibody_source.query("study == @study")[["antibody"]])
+                )
+                for study, data in studies.items()
+            ],
+            ignore_index=True,
+        )
+        .assign(
+            escape=lambda x: (
+                x["escape"] / x.groupby(["antibody", "study"])["escape"].transform("max")
+            )
+        )
+    )
+    assert len(escape) == len(escape.groupby(["antibody", "site"]))
+
+    # drop antibodies with too many sites of substantial escape
+    sig_escape_threshold = config["filter_antibodies"]["sig_escape_threshold"]
+    max_sig_sites = config["filter_antibodies"]["max_sig_sites"]
+    n_sig_escape = (
+        escape
+        .query("escape >= @sig_escape_threshold")
+        .groupby(["antibody", "study"], as_index=False)
+        .aggregate(n_sites=pd.NamedAgg("site", "nunique"))
+    )
+    qc[
+        f"Antibodies by number of sites with escape >= {sig_escape_threshold} "
+        f"(those with more than {max_sig_sites} are dropped)"
+    ] = sig_sites_histogram(n_sig_escape, max_sig_sites)
+    escape = (
+        escape
+        .merge(
+            n_sig_escape.query("n_sites <= @max_sig_sites")[["antibody", "study"]],
+            how="inner",
+            validate="many_to_one",
+        )
+    )
+
+    # drop low escape values
+    drop_escape_below = config["drop_escape_below"]
+    escape = escape.query("escape >= @drop_escape_below")
+    assert escape["antibody"].nunique() == len(escape.groupby(["antibody", "study"]))
+
+    # only keep the antibodies that have all types of measurements
+    antibodies = (
+        pd.DataFrame({"antibody": antibody_source["antibody"].unique()})
+        .merge(
+            pd.DataFrame({"antibody": antibody_ic50s["antibody"].unique()}),
+            how="outer",
+        )
+        .merge(pd.DataFrame({"antibody": escape["antibody"].unique()}), how="outer")
+        .assign(
+            has_source=lambda x: x["antibody"].isin(antibody_source["antibody"]),
+            has_ic50=lambda x: x["antibody"].isin(antibody_ic50s["antibody"]),
+            has_escape=lambda x: x["antibody"].isin(escape["antibody"]),
+            has_all=lambda x: x["has_source"] & x["has_ic50"] & x["has_escape"],
+        )
+    )
+    qc["Number of antibodies with each type of measurement"] = (
+        antibodies
+        .groupby(["has_source", "has_ic50", "has_escape", "has_all"], as_index=False)
+        .aggregate(n_antibodies=pd.NamedAgg("antibody", "count"))
+    )
+    antibodies_to_keep = set(antibodies.query("has_all")["antibody"])
+
+    # unlike for other parameters, we only expect reweightings for some antibodies
+    antibody_reweighting = pd.concat(
+        [data["reweighting"] for data in studies.values() if "reweighting" in data],
+        ignore_index=True,
+    )
+
+    return {
+        "antibody_sources.csv": (
+            antibody_source.query("antibody in @antibodies_to_keep")
+        ),
+        "antibody_IC50s.csv": (
+            antibody_ic50s
+            .query("antibody in @antibodies_to_keep")
+            .drop(columns="study")
+        ),
+        "escape.csv": (
+            escape
+            .query("antibody in @antibodies_to_keep")
+            .drop(columns="study")
+        ),
+        "antibody_reweighting.csv": (
+            antibody_reweighting
+            .query("antibody in @antibodies_to_keep")
+            .drop(columns="study")
+        ),
+        "qc": qc,
+    }
+
+
+STUDIES = {
+    "evolving_2024": (
+        process_evolving_2024,
+        [
+            "JN1-evolving-antibody-response/data/_Table_S2.csv",
+            "JN1-evolving-antibody-response/data/DMS/antibody/"
+            "dms_antibodies_XBB15_JN1_agg.csv",
+        ],
+        [],
+    ),
+    "repeated_2024": (
+        process_repeated_2024,
+        [
+            "SARS-CoV-2-reinfection-DMS/antibody_info.csv",
+            "SARS-CoV-2-reinfection-DMS/antibody_dms_merge_clean.csv.gz",
+        ],
+        ["antibody_reweighting"],
+    ),
+    "imprinted_2022": (
+        process_imprinted_2022,
+        [
+            "convergent_RBD_evolution/antibody_info.xlsx",
+            "convergent_RBD_evolution/use_res_clean.csv",
+        ],
+        [],
+    ),
+}
+"""Maps each study to its processing function, its input files in the data
+directory, and the sections of the configuration it uses."""
+
+AGGREGATE_INPUTS = ["all-repo-duplicates.xlsx"]
+"""Input files in the data directory used by :func:`aggregate_studies`."""
+
+AGGREGATE_CONFIG = ["filter_antibodies", "drop_escape_below", "virus_min_antibodies_w_ic50"]
+"""Sections of the configuration used by :func:`aggregate_studies`."""
+
+RESULTS_FLOAT_FORMAT = {"escape.csv": "%.4g", "antibody_reweighting.csv": "%.4g"}
+"""Float formats of results files written with reduced precision."""
+
+
+class StageCache:
+    """Cache of the outputs of processing stages.
+
+    The output of a stage is stored under a key that is a hash of the name of the
+    stage, the source code of its functions, the SHA-256 hashes of its input
+    files, the sections of the configuration and module constants it uses, and
+    the keys of the stages it depends on. File hashes are remembered along with the size and
+    modification time of the files, so unchanged files are not hashed again.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory in which to cache outputs.
+
+    """
+
+    def __init__(self, cache_dir):
+        """See main class docstring."""
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self._file_hashes_path = os.path.join(cache_dir, "file_hashes.json")
+        try:
+            with open(self._file_hashes_path) as f:
+                self._file_hashes = json.load(f)
+        except FileNotFoundError:
+            self._file_hashes = {}
+
+    def file_hash(self, path):
+        """SHA-256 hash of a file.
+
+        Parameters
+        ----------
+        path : str
+            Path to file.
+
+        Returns
+        -------
+        str
+
+        """
+        stat = os.stat(path)
+        path = os.path.abspath(path)
+        if path in self._file_hashes:
+            size, mtime_ns, sha256 = self._file_hashes[path]
+            if size == stat.st_size and mtime_ns == stat.st_mtime_ns:
+                return sha256
+        file_hash = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                file_hash.update(block)
+        sha256 = file_hash.hexdigest()
+        self._file_hashes[path] = [stat.st_size, stat.st_mtime_ns, sha256]
+        tmp_path = f"{self._file_hashes_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._file_hashes, f, indent=1)
+        os.replace(tmp_path, self._file_hashes_path)
+        return sha256
+
+    def key(
+        self, name, funcs, input_files, config_sections, dependencies=(), constants=None
+    ):
+        """Key for the output of a stage.
+
+        Parameters
+        ----------
+        name : str
+            Name of the stage.
+        funcs : list of callables
+            Functions run by the stage.
+        input_files : list of str
+            Paths to input files of the stage.
+        config_sections : dict
+            Sections of the configuration used by the stage.
+        dependencies : list of str
+            Keys of stages whose outputs are used by the stage.
+        constants : None or dict
+            Values of module constants used by the stage, keyed by their names.
+
+        Returns
+        -------
+        str
+
+        """
+        return hashlib.sha256(
+            json.dumps(
+                [
+                    name,
+                    [inspect.getsource(func) for func in funcs],
+                    [self.file_hash(path) for path in input_files],
+                    config_sections,
+                    list(dependencies),
+                    constants or {},
+                ],
+                sort_keys=True,
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def load(self, key):
+        """Get the output of a stage from the cache.
+
+        Parameters
+        ----------
+        key : str
+            Key from :meth:`StageCache.key`.
+
+        Returns
+        -------
+        object or None
+            The output of the stage, or `None` if it is not cached.
+
+        """
+        path = os.path.join(self.cache_dir, f"{key}.pickle")
+        if os.path.isfile(path):
+            return pd.read_pickle(path)
+        return None
+
+    def save(self, key, output):
+        """Cache the output of a stage.
+
+        Parameters
+        ----------
+        key : str
+            Key from :meth:`StageCache.key`.
+        output : object
+            Pickleable output of the stage.
+
+        """
+        path = os.path.join(self.cache_dir, f"{key}.pickle")
+        pd.to_pickle(output, f"{path}.{os.getpid()}.tmp")
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+
+def print_qc(qc):
+    """Print the quality-control summaries of a stage.
+
+    Parameters
+    ----------
+    qc : dict
+        Maps titles to data frames, as under "qc" in the output of a stage.
+
+    Example
+    -------
+    >>> print_qc({"Dropped antibodies": pd.DataFrame({"antibody": ["a", "b"]})})
+    <BLANKLINE>
+    Dropped antibodies:
+    antibody
+           a
+           b
+    >>> print_qc({"Dropped antibodies": pd.DataFrame({"antibody": []})})
+    <BLANKLINE>
+    Dropped antibodies: none
+
+    """
+    for title, df in qc.items():
+        if len(df):
+            print(f"\n{title}:\n{df.to_string(index=False)}", flush=True)
+        else:
+            print(f"\n{title}: none", flush=True)
+
+
+def process_data(
+    config="config.yaml",
+    data_dir="Cao_data",
+    results_dir="results",
+    cache_dir=".process_data_cache",
+    *,
+    force=False,
+    max_workers=None,
+    verbose=True,
+):
+    """Process the data, only rerunning stages whose inputs changed.
+
+    Stages for different studies that need to be run are run in parallel processes.
+
+    Parameters
+    ----------
+    config : str
+        Path to YAML file with configuration.
+    data_dir : str
+        Directory with the data from the papers.
+    results_dir : str
+        Directory in which to write the results files.
+    cache_dir : str
+        Directory in which to cache the outputs of stages.
+    force : bool
+        Rerun all stages even if their outputs are cached.
+    max_workers : None or int
+        Maximum number of processes for running study stages in parallel. If `None`,
+        the number of processors. If 1, run them in this process.
+    verbose : bool
+        Print which stages are run or cached, and the quality-control summaries
+        of the stages (see :func:`print_qc`).
+
+    Returns
+    -------
+    dict
+        Data frames written to the results files, keyed by their file names.
+
+    """
+    with open(config) as f:
+        config = yaml.safe_load(f)
+    cache = StageCache(cache_dir)
+
+    study_keys = {
+        study: cache.key(
+            study,
+            [func, aggregate_site_escape],
+            [os.path.join(data_dir, f) for f in input_files],
+            {section: config[section] for section in config_sections},
+        )
+        for study, (func, input_files, config_sections) in STUDIES.items()
+    }
+    studies = {
+        study: None if force else cache.load(key) for study, key in study_keys.items()
+    }
+    to_run = [study for study, output in studies.items() if output is None]
+    if verbose:
+        for study in studies:
+            if study not in to_run:
+                print(f"Using cached {study}", flush=True)
+
+    def save(study, output):
+        studies[study] = output
+        cache.save(study_keys[study], output)
+        if verbose:
+            print(f"Processed {study}", flush=True)
+
+    if max_workers == 1 or len(to_run) <= 1:
+        for study in to_run:
+            save(study, STUDIES[study][0](data_dir, config))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(len(to_run), max_workers or os.cpu_count())
+        ) as executor:
+            futures = {
+                executor.submit(STUDIES[study][0], data_dir, config): study
+                for study in to_run
+            }
+            for future in concurrent.futures.as_completed(futures):
+                save(futures[future], future.result())
+
+    key = cache.key(
+        "aggregate",
+        [aggregate_studies, sig_sites_histogram],
+        [os.path.join(data_dir, f) for f in AGGREGATE_INPUTS],
+        {section: config[section] for section in AGGREGATE_CONFIG},
+        list(study_keys.values()),
+        {
+            "AGGREGATE_INPUTS": AGGREGATE_INPUTS,
+            "AGGREGATE_CONFIG": AGGREGATE_CONFIG,
+            "RESULTS_FLOAT_FORMAT": RESULTS_FLOAT_FORMAT,
+        },
+    )
+    results = None if force else cache.load(key)
+    if results is None:
+        results = aggregate_studies(data_dir, config, studies)
+        cache.save(key, results)
+        if verbose:
+            print("Aggregated studies", flush=True)
+    elif verbose:
+        print("Using cached aggregation of studies", flush=True)
+
+    if verbose:
+        for output in [*studies.values(), results]:
+            print_qc(output.get("qc", {}))
+
+    results = {filename: df for filename, df in results.items() if filename != "qc"}
+    os.makedirs(results_dir, exist_ok=True)
+    for filename, df in results.items():
+        df.to_csv(
+            os.path.join(results_dir, filename),
+            float_format=RESULTS_FLOAT_FORMAT.get(filename),
+            index=False,
+        )
+        if verbose:
+            print(f"Wrote {len(df)} rows to {os.path.join(results_dir, filename)}")
+
+    return results
+
+
+if __name__ == "__main__":
+
+    # Command line interface
+    parser = argparse.ArgumentParser(
+        description="Process the deep mutational scanning data for the calculator."
+    )
+
+    parser.add_argument(
+        "--config",
+        type=str,
+        default="config.yaml",
+        help="Path to YAML file with configuration.",
+    )
+
+    parser.add_argument(
+        "--data_dir",
+        type=str,
+        default="Cao_data",
+        help="Directory with the data from the papers.",
+    )
+
+    parser.add_argument(
+        "--results_dir",
+        type=str,
+        default="results",
+        help="Directory in which to write the results files.",
+    )
+
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        default=".process_data_cache",
+        help="Directory in which to cache the outputs of processing stages.",
+    )
+
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rerun all stages even if their outputs are cached.",
+    )
+
+    parser.add_argument(
+        "--max_workers",
+        type=int,
+        required=False,
+        help="Maximum number of processes for processing studies in parallel.",
+    )
+
+    args = parser.parse_args()
+
+    process_data(
+        args.config,
+        args.data_dir,
+        args.results_dir,
+        args.cache_dir,
+        force=args.force,
+        max_workers=args.max_workers,
+    )
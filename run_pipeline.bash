@@ -2,12 +2,8 @@
 
 set -euo pipefail
 
-# run `process_data.ipynb`
-jupyter nbconvert \
-    --to notebook \
-    --inplace \
-    --execute process_data.ipynb \
-    --ExecutePreprocessor.timeout=-1
+# run `process_data.py`, which only reruns stages whose inputs changed
+python process_data.py
 
 # run `plot_calculator.ipynb`
 jupyter nbconvert \
@@ -28,4 +24,6 @@ python format_altair_html.py \
     --title "SARS-CoV-2 RBD antibody escape calculator" \
     --description "Calculate antibody escape by mutations to SARS-CoV-2 RBD" \
     --google_analytics_tag data_for_plot_formatting/google_analytics_tag.html \
+    --no_prettify \
+    --minify \
     --output docs/index.html